@@ -0,0 +1,179 @@
+"""Columnar snapshots of jobs and quotes for the admin analytics view.
+
+`Analytics` keeps one pandas frame of jobs (with their first-message, first-quote and
+completion milestones, as the job room's timeline shows them) and one of quotes. The
+first call loads everything; later calls read the event log for jobs changed since
+the last refresh and reload only those rows. All reporting is vectorized over the
+frames.
+
+Archived jobs are included: the cold store keeps their quotes and milestones in
+index tables (see archive.py), so reports cover all work, like the dashboard tiles.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from events import EventBus
+from storage import JobStore
+
+JOB_FIELDS = ["id", "created", "status", "category", "assigned_tech", "completed", "first_message", "first_quote"]
+QUOTE_FIELDS = ["job_id", "id", "amount", "status", "technician", "created"]
+JOB_TIMES = ["created", "completed", "first_message", "first_quote"]
+
+# Timestamps are parsed by SQLite into epoch milliseconds: far cheaper than parsing
+# ISO strings in pandas, and the same millisecond precision as records.py
+_MS = "(julianday({}) - 2440587.5) * 86400000.0"
+JOBS_SQL = f"""
+    SELECT j.id, {_MS.format("j.created")}, j.status, j.category, j.assigned_tech, {_MS.format("j.completed")},
+        {_MS.format("(SELECT timestamp FROM messages WHERE job_id = j.id AND timestamp IS NOT NULL ORDER BY id LIMIT 1)")},
+        {_MS.format("(SELECT created FROM quotes WHERE job_id = j.id ORDER BY seq LIMIT 1)")}
+    FROM jobs j
+"""
+QUOTES_SQL = f"SELECT job_id, id, amount, status, technician, {_MS.format('created')} FROM quotes"
+ARCHIVED_JOBS_SQL = f"""
+    SELECT id, {_MS.format("created")}, status, category, assigned_tech, {_MS.format("completed")},
+        {_MS.format("first_message")}, {_MS.format("first_quote")}
+    FROM archived_jobs
+"""
+ARCHIVED_QUOTES_SQL = f"SELECT job_id, id, amount, status, technician, {_MS.format('created')} FROM archived_quotes"
+
+# Above this many changed jobs a full reload is cheaper than patching the frames
+MAX_INCREMENTAL = 2000
+
+
+def _frame(rows: List[tuple], columns: List[str], times: Iterable[str]) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in times:
+        df[col] = pd.to_datetime(df[col].astype(float).round(), unit="ms")
+    return df
+
+
+class Analytics:
+    def __init__(self, store: JobStore, bus: Optional[EventBus] = None):
+        self.store = store
+        self.bus = bus
+        self._lock = threading.Lock()
+        self._cursor: Optional[int] = None
+        self.jobs = _frame([], JOB_FIELDS, JOB_TIMES)
+        self.quotes = _frame([], QUOTE_FIELDS, ["created"])
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def _query(self, sql: str, column: str, job_ids: Optional[List[str]]) -> List[tuple]:
+        conn = self.store.conn
+        if job_ids is None:
+            return conn.execute(sql).fetchall()
+        rows = []
+        for i in range(0, len(job_ids), 500):
+            chunk = job_ids[i:i + 500]
+            rows += conn.execute(f"{sql} WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+        return rows
+
+    def _load(self, job_ids: Optional[List[str]] = None):
+        job_rows = self._query(JOBS_SQL, "j.id", job_ids)
+        quote_rows = self._query(QUOTES_SQL, "job_id", job_ids)
+        if self.store.archive is not None:
+            # Archiving a job is an event too, so a reload finds it in one place or the other
+            job_rows += self._query(ARCHIVED_JOBS_SQL, "id", job_ids)
+            quote_rows += self._query(ARCHIVED_QUOTES_SQL, "job_id", job_ids)
+        jobs = _frame(job_rows, JOB_FIELDS, JOB_TIMES)
+        quotes = _frame(quote_rows, QUOTE_FIELDS, ["created"])
+        return jobs, quotes
+
+    def refresh(self):
+        """Bring the frames up to date with the store."""
+        with self._lock:
+            changed = None
+            if self.bus is not None and self._cursor is not None:
+                changed = self.bus.changed_since(self._cursor)
+            if changed is not None and not changed[0]:
+                return
+            if changed is None or len(changed[0]) > MAX_INCREMENTAL:
+                # Cursor first: anything written while loading is picked up next time
+                cursor = self.bus.head() if self.bus is not None else None
+                self.jobs, self.quotes = self._load()
+                self._cursor = cursor
+                self.full_loads += 1
+                return
+            ids, cursor = changed
+            ids = sorted(ids)
+            jobs, quotes = self._load(ids)
+            keep_jobs = self.jobs[~self.jobs["id"].isin(ids)]
+            keep_quotes = self.quotes[~self.quotes["job_id"].isin(ids)]
+            self.jobs = pd.concat([keep_jobs, jobs], ignore_index=True) if len(jobs) else keep_jobs
+            self.quotes = pd.concat([keep_quotes, quotes], ignore_index=True) if len(quotes) else keep_quotes
+            self._cursor = cursor
+            self.incremental_loads += 1
+
+    def snapshot(self):
+        """(jobs, quotes) frames, refreshed first. Treat them as read-only."""
+        self.refresh()
+        return self.jobs, self.quotes
+
+
+def _hours(delta: pd.Series) -> pd.Series:
+    return delta.dt.total_seconds() / 3600
+
+
+def _describe(hours: pd.Series) -> Dict[str, float]:
+    hours = hours.dropna()
+    hours = hours[hours >= 0]
+    if hours.empty:
+        return {"jobs": 0, "median_h": np.nan, "p90_h": np.nan, "mean_h": np.nan}
+    return {
+        "jobs": int(hours.size),
+        "median_h": float(hours.median()),
+        "p90_h": float(hours.quantile(0.9)),
+        "mean_h": float(hours.mean()),
+    }
+
+
+def report(jobs: pd.DataFrame, quotes: pd.DataFrame, since: Optional[pd.Timestamp] = None, freq: str = "D") -> Dict:
+    """Revenue, approval and turnaround figures for jobs created since `since`.
+
+    Revenue is approved quote amounts, dated by the quote and attributed to the job's
+    category and the quoting technician (as the dashboard metrics do). `freq` is a
+    pandas period alias for the revenue series: "D" days, "W" weeks, "M" months.
+    """
+    if since is not None:
+        jobs = jobs[jobs["created"] >= since]
+        quotes = quotes[quotes["job_id"].isin(jobs["id"])]
+
+    quotes = quotes.merge(jobs[["id", "category"]].rename(columns={"id": "job_id"}), on="job_id", how="left")
+    approved = quotes[quotes["status"] == "approved"]
+    decided = quotes["status"].isin(["approved", "declined"])
+
+    revenue = approved.dropna(subset=["created"])
+    by_period = (
+        revenue.groupby(revenue["created"].dt.to_period(freq))["amount"].sum()
+        if len(revenue) else pd.Series(dtype=float)
+    )
+    by_period.index = by_period.index.to_timestamp() if len(by_period) else by_period.index
+
+    def by_key(column: str) -> pd.DataFrame:
+        keyed = quotes.assign(key=quotes[column].fillna("—"), decided=decided,
+                              approved=quotes["status"] == "approved")
+        grouped = keyed.groupby("key").agg(
+            quotes=("id", "size"),
+            approved=("approved", "sum"),
+            decided=("decided", "sum"),
+        )
+        grouped["revenue"] = approved.groupby(approved[column].fillna("—"))["amount"].sum()
+        grouped["revenue"] = grouped["revenue"].fillna(0.0)
+        grouped["approval_rate"] = grouped["approved"] / grouped["decided"].replace(0, np.nan)
+        return grouped.sort_values("revenue", ascending=False)
+
+    return {
+        "jobs": int(len(jobs)),
+        "quotes": int(len(quotes)),
+        "revenue": float(approved["amount"].sum()),
+        "approval_rate": float((quotes["status"] == "approved").sum() / decided.sum()) if decided.any() else np.nan,
+        "revenue_by_period": by_period,
+        "by_category": by_key("category"),
+        "by_technician": by_key("technician"),
+        "time_to_first_quote": _describe(_hours(jobs["first_quote"] - jobs["created"])),
+        "time_to_first_message": _describe(_hours(jobs["first_message"] - jobs["created"])),
+        "open_to_completed": _describe(_hours(jobs["completed"] - jobs["created"])),
+    }
@@ -1,14 +1,27 @@
 import streamlit as st
 from datetime import datetime, timedelta
 import uuid
+import html
 import os
 import json
-from PIL import Image
-import io
-import base64
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
 import time
-from collections import defaultdict
+from streamlit.errors import StreamlitAPIException
+
+import profiling
+from analytics import Analytics, report
+from archive import ARCHIVE_AFTER_DAYS, ColdStore
+from cache import JobCache
+from events import EventBus
+from media import (
+    MEDIA_URL, BlobStore, backfill_derivatives, ingest_uploads, ingest_video,
+    migrate_inline_photos, start_media_server
+)
+from notify import Notifier
+from search import SearchIndex, highlight
+from storage import JobStore
+from transfer import EXPORT_DIR, PARQUET_SUPPORTED, export_jobs, import_jobs, import_status
 
 # Page config
 st.set_page_config(
@@ -70,43 +83,213 @@ st.markdown("""
 
 # Initialize session state
 def init_session_state():
-    if "jobs" not in st.session_state:
-        st.session_state.jobs = {}
-    if "users" not in st.session_state:
-        st.session_state.users = {}
     if "current_user" not in st.session_state:
         st.session_state.current_user = None
-    if "notifications" not in st.session_state:
-        st.session_state.notifications = defaultdict(list)
 
 init_session_state()
 
-# Mock database class (replace with real DB in production)
+JOB_STATUSES = ["open", "in_progress", "quoted", "approved", "completed", "cancelled"]
+JOB_CATEGORIES = ["Plumbing", "Electrical", "HVAC", "Appliance", "Structural", "Other"]
+JOB_PRIORITIES = ["low", "medium", "high", "emergency"]
+
+# Who is making a change, for the notifier: the user's email, or their role if we have none
+def current_actor() -> Optional[str]:
+    user = st.session_state.current_user or {}
+    return user.get("email") or user.get("role")
+
+# One store per server process; SQLite (WAL) shares the data across sessions and processes
+@st.cache_resource
+def get_store() -> JobStore:
+    store = JobStore()
+    EventBus(store).prune()
+    SearchIndex(store)
+    ColdStore(store)
+    migrate_inline_photos(store, get_blobs())
+    backfill_derivatives(store, get_blobs())
+    return store
+
+# Hot job rows and quotes, validated against the job's version on every read
+@st.cache_resource
+def get_job_cache() -> JobCache:
+    return JobCache(get_store(), bus=get_bus())
+
+# Columnar jobs/quotes snapshot for reporting, refreshed from the event log
+@st.cache_resource
+def get_analytics() -> Analytics:
+    return Analytics(get_store(), bus=get_bus())
+
+# Change events for live updates; shared across processes through the events table
+def get_bus() -> EventBus:
+    return get_store().bus
+
+# Delivers job notifications from a background thread, never from a rerun
+@st.cache_resource
+def get_notifier() -> Notifier:
+    return Notifier(get_store()).start()
+
+# Closed jobs past ARCHIVE_AFTER_DAYS live in compressed segments, rehydrated on demand
+def get_archive() -> ColdStore:
+    return get_store().archive
+
+# Photos and other media are stored on disk by SHA-256; jobs only keep the hash
+@st.cache_resource
+def get_blobs() -> BlobStore:
+    return BlobStore()
+
+# Videos are streamed to the browser by a range-capable server instead of through the script
+@st.cache_resource
+def get_media_server():
+    return start_media_server(get_blobs(), get_store().media_content_type)
+
+# Database facade used by the UI
 class MockDB:
     @staticmethod
     def save_job(job_id: str, job_data: Dict):
-        st.session_state.jobs[job_id] = job_data
+        get_store().save_job(job_id, job_data)
     
     @staticmethod
     def get_job(job_id: str) -> Optional[Dict]:
-        return st.session_state.jobs.get(job_id)
+        return get_store().get_job(job_id)
+    
+    @staticmethod
+    def get_job_summary(job_id: str) -> Optional[Dict]:
+        return get_job_cache().get_job_summary(job_id)
+    
+    @staticmethod
+    def get_messages(job_id: str, after_id: Optional[int] = None,
+                     before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        return get_store().get_messages(job_id, after_id, before_id, limit)
+    
+    @staticmethod
+    def has_messages_before(job_id: str, message_id: int) -> bool:
+        return get_store().has_messages_before(job_id, message_id)
+    
+    @staticmethod
+    def get_quotes(job_id: str) -> List[Dict]:
+        return get_job_cache().get_quotes(job_id)
+    
+    @staticmethod
+    def get_milestones(job_id: str) -> Dict:
+        return get_store().get_milestones(job_id)
+    
+    @staticmethod
+    def find_jobs(**filters) -> List[Dict]:
+        return get_store().find_jobs(**filters)
+    
+    @staticmethod
+    def get_metrics(scope: str = "all") -> Dict[str, Dict[str, float]]:
+        return get_store().get_metrics(scope)
+    
+    @staticmethod
+    def check_metrics() -> Dict:
+        return get_store().check_metrics()
+    
+    @staticmethod
+    def rebuild_metrics():
+        get_store().rebuild_metrics()
+    
+    @staticmethod
+    def query_jobs(**query):
+        return get_store().query_jobs(**query)
+    
+    @staticmethod
+    def count_jobs(**filters) -> int:
+        return get_store().count_jobs(**filters)
+    
+    @staticmethod
+    def update_jobs(job_ids: List[str], **fields):
+        get_store().update_jobs(job_ids, actor=current_actor(), **fields)
+    
+    @staticmethod
+    def delete_jobs(job_ids: List[str]):
+        get_store().delete_jobs(job_ids)
+    
+    @staticmethod
+    def dispatch_queue(category: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        return get_store().dispatch_queue(category, limit)
+    
+    @staticmethod
+    def claim_job(job_id: str, tech: str) -> bool:
+        return get_store().claim_job(job_id, tech)
+    
+    @staticmethod
+    def claim_next(tech: str, category: Optional[str] = None) -> Optional[str]:
+        return get_store().claim_next(tech, category)
+    
+    @staticmethod
+    def search_jobs(text: str, limit: int = 10, offset: int = 0):
+        return get_store().search.search(text, limit, offset)
+    
+    @staticmethod
+    def get_archived_job(job_id: str) -> Optional[Dict]:
+        return get_archive().get(job_id)
+    
+    @staticmethod
+    def find_archived_jobs(**filters) -> List[Dict]:
+        return get_archive().find(**filters)
     
     @staticmethod
     def get_all_jobs() -> Dict:
-        return st.session_state.jobs
+        return get_store().get_all_jobs()
+    
+    @staticmethod
+    def delete_job(job_id: str):
+        get_store().delete_job(job_id)
+    
+    @staticmethod
+    def update_job_fields(job_id: str, **fields):
+        get_store().update_job_fields(job_id, actor=current_actor(), **fields)
+    
+    @staticmethod
+    def append_message(job_id: str, msg: Dict) -> int:
+        return get_store().append_message(job_id, msg)
+    
+    @staticmethod
+    def add_photo(job_id: str, photo: Dict) -> int:
+        return get_store().add_photo(job_id, photo, actor=current_actor())
+    
+    @staticmethod
+    def get_photos(job_id: str, offset: int = 0, limit: int = 12) -> List[Dict]:
+        return get_store().get_photos(job_id, offset, limit)
+    
+    @staticmethod
+    def get_photo(photo_id: int) -> Optional[Dict]:
+        return get_store().get_photo(photo_id)
+    
+    @staticmethod
+    def count_photos(job_id: str) -> int:
+        return get_store().count_photos(job_id)
+    
+    @staticmethod
+    def add_video(job_id: str, video: Dict) -> int:
+        return get_store().add_video(job_id, video)
+    
+    @staticmethod
+    def get_videos(job_id: str) -> List[Dict]:
+        return get_store().get_videos(job_id)
+    
+    @staticmethod
+    def add_quote(job_id: str, quote: Dict):
+        get_store().add_quote(job_id, quote)
+    
+    @staticmethod
+    def set_quote_status(job_id: str, quote_id: str, status: str):
+        get_store().set_quote_status(job_id, quote_id, status, actor=current_actor())
     
     @staticmethod
     def add_user(email: str, password: str, role: str):
-        st.session_state.users[email] = {
-            "password": password,
-            "role": role,
-            "created": datetime.now().isoformat()
-        }
+        get_store().add_user(email, password, role)
+    
+    @staticmethod
+    def get_user(email: str) -> Optional[Dict]:
+        return get_store().get_user(email)
     
     @staticmethod
     def authenticate(email: str, password: str) -> bool:
-        user = st.session_state.users.get(email)
-        return user and user["password"] == password
+        return get_store().authenticate(email, password)
+
+# Every facade call is timed as a "db.<method>" span
+profiling.instrument(MockDB, "db")
 
 # Authentication system
 def show_auth():
@@ -150,7 +333,7 @@ def show_auth():
             st.divider()
             existing_job = st.text_input("Already have a job ID?")
             if st.button("Access Existing Job", use_container_width=True):
-                if existing_job and MockDB.get_job(existing_job):
+                if existing_job and (MockDB.get_job_summary(existing_job) or MockDB.get_archived_job(existing_job)):
                     st.session_state.current_user = {
                         "role": "customer",
                         "job_id": existing_job
@@ -168,7 +351,7 @@ def show_auth():
             if st.button("Login as Technician", type="primary", use_container_width=True):
                 if tech_email and tech_pass:
                     # For demo - create user if not exists
-                    if tech_email not in st.session_state.users:
+                    if MockDB.get_user(tech_email) is None:
                         MockDB.add_user(tech_email, tech_pass, "technician")
                     
                     if MockDB.authenticate(tech_email, tech_pass):
@@ -190,10 +373,376 @@ def show_auth():
                     st.session_state.current_user = {"role": "admin"}
                     st.rerun()
 
+# Rerun just the calling fragment; a full rerun when the section ran as part of the whole page
+def rerun_section():
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+# Gallery heading and page picker, shared by the live and archived job rooms.
+# Returns (offset, limit) of the page to show, newest photos first.
+def gallery_page(job_id: str, photo_count: int) -> Tuple[int, int]:
+    st.markdown(f"### 📸 Gallery ({photo_count} images)")
+    page_size = 12
+    pages = (photo_count + page_size - 1) // page_size
+    page = 1
+    if pages > 1:
+        page = st.number_input(
+            f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+            key=f"photo_page_{job_id}"
+        )
+    return (page - 1) * page_size, page_size
+
+# Videos show their poster until the user asks to play one
+def show_videos(job_id: str, videos: Optional[List[Dict]] = None):
+    if videos is None:
+        videos = MockDB.get_videos(job_id)
+    if not videos:
+        return
+    get_media_server()
+    st.markdown(f"### 🎬 Videos ({len(videos)})")
+    playing_key = f"playing_video_{job_id}"
+    cols = st.columns(3)
+    for idx, video in enumerate(videos):
+        with cols[idx % 3]:
+            if st.session_state.get(playing_key) == video["id"]:
+                st.video(f"{MEDIA_URL}/{video['sha256']}", format=video.get("content_type", "video/mp4"))
+            elif video.get("poster_sha256"):
+                st.image(get_blobs().path(video["poster_sha256"]), use_column_width=True)
+                profiling.count("images_rendered")
+            else:
+                st.markdown("<div style='aspect-ratio:16/9;background:#222;border-radius:8px'></div>", unsafe_allow_html=True)
+            duration = video.get("duration")
+            length = f"{int(duration // 60)}:{int(duration % 60):02d} · " if duration else ""
+            st.caption(f"{video.get('name', 'Video')} · {length}{video.get('size', 0) / 1e6:.1f} MB · by {video.get('uploaded_by', 'unknown')}")
+            if st.session_state.get(playing_key) != video["id"]:
+                if st.button("▶ Play", key=f"play_video_{video['id']}"):
+                    st.session_state[playing_key] = video["id"]
+                    rerun_section()
+
+# Job room: photos section
+@st.fragment
+@profiling.timed("section.photos")
+def show_photos_section(job_id: str):
+    st.subheader("Visual Documentation")
+
+    # Upload section
+    with st.expander("📤 Add Photos/Video", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            uploaded = st.file_uploader(
+                "Upload photos",
+                accept_multiple_files=True,
+                type=["png", "jpg", "jpeg", "heic"],
+                key=f"upload_{job_id}"
+            )
+        with col2:
+            video = st.file_uploader("Upload video", type=["mp4", "mov"], key=f"video_{job_id}")
+            video_seen = st.session_state.setdefault(f"video_ingested_{job_id}", set())
+            if video and video.file_id not in video_seen:
+                with st.spinner(f"Saving {video.name}..."):
+                    video.seek(0)
+                    info = ingest_video(video, video.type or "video/mp4", get_blobs())
+                    MockDB.add_video(job_id, {
+                        **info,
+                        "name": video.name,
+                        "timestamp": datetime.now().isoformat(),
+                        "uploaded_by": st.session_state.current_user.get("role", "unknown")
+                    })
+                video_seen.add(video.file_id)
+                st.success(f"Added video {video.name}")
+
+        # The uploader keeps its files across reruns; only ingest ones not seen yet
+        seen = st.session_state.setdefault(f"ingested_{job_id}", set())
+        pending = [f for f in (uploaded or []) if f.file_id not in seen]
+        if pending:
+            progress = st.progress(0.0, text=f"Processing {len(pending)} photo(s)...")
+            names = {f.file_id: f.name for f in pending}
+            added, failed = 0, []
+            payloads = [(f.file_id, f.getvalue()) for f in pending]
+            profiling.count("bytes_decoded", sum(len(data) for _, data in payloads))
+            results = ingest_uploads(payloads, get_blobs().root)
+            for done, (file_id, photo, error) in enumerate(results, start=1):
+                seen.add(file_id)
+                name = names[file_id]
+                if error:
+                    failed.append(f"{name}: {error}")
+                else:
+                    MockDB.add_photo(job_id, {
+                        **photo,
+                        "timestamp": datetime.now().isoformat(),
+                        "uploaded_by": st.session_state.current_user.get("role", "unknown")
+                    })
+                    added += 1
+                progress.progress(done / len(pending), text=f"Processed {name} ({done}/{len(pending)})")
+            for failure in failed:
+                st.error(f"Could not process {failure}")
+            if added:
+                st.success(f"Added {added} photo(s)")
+                if not failed:
+                    rerun_section()
+
+    # Display photos in grid: thumbnails only, newest first, paged
+    photo_count = MockDB.count_photos(job_id)
+    if photo_count:
+        offset, limit = gallery_page(job_id, photo_count)
+        photos = MockDB.get_photos(job_id, offset=offset, limit=limit)
+        cols = st.columns(4)
+        for idx, photo in enumerate(photos):
+            with cols[idx % 4]:
+                thumb = photo.get("thumb_sha256") or photo["sha256"]
+                st.image(get_blobs().path(thumb), use_column_width=True)
+                profiling.count("images_rendered")
+                st.caption(f"Added by {photo['uploaded_by']}")
+                if st.button("🔍 Open", key=f"open_photo_{photo['id']}"):
+                    st.session_state[f"open_photo_{job_id}"] = photo["id"]
+
+        # Full-size view is only loaded for the photo the user opened
+        open_id = st.session_state.get(f"open_photo_{job_id}")
+        opened = MockDB.get_photo(open_id) if open_id else None
+        if opened:
+            st.divider()
+            show_original = st.toggle("Original resolution", key=f"photo_original_{job_id}")
+            digest = opened["sha256"] if show_original else opened.get("preview_sha256", opened["sha256"])
+            st.image(get_blobs().path(digest), use_column_width=True)
+            profiling.count("images_rendered")
+            if opened.get("width"):
+                st.caption(f"{opened['width']}×{opened['height']} · {opened.get('size', 0) // 1024} KB")
+            if st.button("Close photo", key=f"close_photo_{job_id}"):
+                del st.session_state[f"open_photo_{job_id}"]
+                rerun_section()
+    else:
+        st.info("No photos uploaded yet. Add photos to help technicians understand the issue.")
+    
+    show_videos(job_id)
+
+# Messages never change once stored, so their HTML is built once per message id
+@st.cache_data(max_entries=20000, show_spinner=False)
+def message_html(msg_id: int, msg_type: Optional[str], role: Optional[str],
+                 sender: Optional[str], time_str: Optional[str], text: str) -> str:
+    text = html.escape(text)
+    if msg_type == "system":
+        return f"<div>🔔 <em>{text}</em></div>"
+    if role == "customer":
+        return (
+            f"<div class='message-customer'><strong>👤 Customer</strong> "
+            f"<small>{html.escape(time_str or '')}</small><br>{text}</div>"
+        )
+    return (
+        f"<div class='message-technician'><strong>🔧 {html.escape(sender or 'Technician')}</strong> "
+        f"<small>{html.escape(time_str or '')}</small><br>{text}</div>"
+    )
+
+CHAT_PAGE_SIZE = 50
+CHAT_POLL_SECONDS = 2
+
+# Polls the event bus and appends only messages newer than the last one on screen
+@st.fragment(run_every=CHAT_POLL_SECONDS)
+@profiling.timed("section.chat_log")
+def show_chat_log(job_id: str):
+    chat = st.session_state[f"chat_{job_id}"]
+    events = get_bus().poll(job_id, chat["cursor"])
+    if events:
+        chat["cursor"] = events[-1]["id"]
+        if any(e["kind"] == "message" for e in events):
+            last_id = chat["messages"][-1]["id"] if chat["messages"] else 0
+            new_messages = MockDB.get_messages(job_id, after_id=last_id)
+            chat["messages"].extend(new_messages)
+            role = st.session_state.current_user.get("role")
+            for m in new_messages:
+                if m.get("type") != "system" and m.get("role") != role:
+                    st.toast(f"💬 {m.get('sender') or m.get('role', 'New message')}: {m['text'][:60]}")
+    
+    with st.container(height=400):
+        if chat["messages"]:
+            profiling.count("messages_rendered", len(chat["messages"]))
+            # One markdown element for the whole log instead of one (plus columns) per message
+            st.markdown(
+                "\n\n".join(
+                    message_html(m["id"], m.get("type"), m.get("role"), m.get("sender"), m.get("time"), m["text"])
+                    for m in chat["messages"]
+                ),
+                unsafe_allow_html=True
+            )
+
+# Job room: chat section
+@st.fragment
+@profiling.timed("section.chat")
+def show_chat_section(job_id: str):
+    st.subheader("Live Collaboration")
+
+    # Messages on screen live in session state: the newest page on first view, older
+    # pages prepended on request, new ones appended by the polling log below
+    chat_key = f"chat_{job_id}"
+    if chat_key not in st.session_state:
+        cursor = get_bus().head(job_id)
+        st.session_state[chat_key] = {
+            "messages": MockDB.get_messages(job_id, limit=CHAT_PAGE_SIZE),
+            "cursor": cursor
+        }
+    chat = st.session_state[chat_key]
+    
+    if chat["messages"] and MockDB.has_messages_before(job_id, chat["messages"][0]["id"]):
+        if st.button("⬆️ Load older messages", key=f"chat_older_{job_id}"):
+            older = MockDB.get_messages(job_id, before_id=chat["messages"][0]["id"], limit=CHAT_PAGE_SIZE)
+            chat["messages"] = older + chat["messages"]
+            rerun_section()
+    
+    show_chat_log(job_id)
+
+    # Chat input
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        message = st.text_input(
+            "Type your message...",
+            key=f"chat_input_{job_id}",
+            label_visibility="collapsed"
+        )
+    with col2:
+        if st.button("Send", type="primary", use_container_width=True):
+            if message:
+                msg = {
+                    "role": st.session_state.current_user.get("role", "unknown"),
+                    "text": message,
+                    "time": datetime.now().strftime("%I:%M %p"),
+                    "sender": st.session_state.current_user.get("email", ""),
+                    "timestamp": datetime.now().isoformat()
+                }
+                MockDB.append_message(job_id, msg)
+                rerun_section()
+
+# Job room: quotes section
+@st.fragment
+@profiling.timed("section.quotes")
+def show_quotes_section(job_id: str):
+    quotes = MockDB.get_quotes(job_id)
+    st.subheader("Quotes & Pricing")
+
+    # Technician quote submission
+    if st.session_state.current_user.get("role") == "technician":
+        with st.expander("💵 Create New Quote", expanded=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                amount = st.number_input("Amount ($)", min_value=0.0, step=10.0)
+                breakdown = st.text_area("Breakdown", placeholder="Labor: $200\nParts: $150\nTax: $35")
+            with col2:
+                timeline = st.selectbox("Timeline", ["ASAP", "1-2 days", "3-5 days", "1 week+", "Custom"])
+                warranty = st.selectbox("Warranty", ["30 days", "90 days", "1 year", "Lifetime"])
+
+            if st.button("Submit Quote", type="primary", use_container_width=True):
+                quote_id = str(uuid.uuid4())[:8]
+                MockDB.add_quote(job_id, {
+                    "id": quote_id,
+                    "amount": amount,
+                    "breakdown": breakdown,
+                    "timeline": timeline,
+                    "warranty": warranty,
+                    "technician": st.session_state.current_user.get("email"),
+                    "created": datetime.now().isoformat(),
+                    "status": "pending"
+                })
+                MockDB.append_message(job_id, {
+                    "type": "system",
+                    "text": f"New quote submitted for ${amount}",
+                    "timestamp": datetime.now().isoformat()
+                })
+                st.success("Quote submitted!")
+                rerun_section()
+
+    # Display quotes
+    if quotes:
+        for quote in reversed(quotes):
+            with st.container():
+                st.markdown(f"""
+                <div class='quote-card'>
+                    <h3>${quote['amount']:.2f}</h3>
+                    <p><strong>Timeline:</strong> {quote['timeline']}</p>
+                    <p><strong>Warranty:</strong> {quote['warranty']}</p>
+                    <p><strong>By:</strong> {quote['technician']}</p>
+                    <small>{quote['created'][:10]}</small>
+                </div>
+                """, unsafe_allow_html=True)
+
+                col1, col2 = st.columns(2)
+                if st.session_state.current_user.get("role") == "customer":
+                    with col1:
+                        if st.button("✅ Approve", key=f"approve_{quote['id']}"):
+                            MockDB.set_quote_status(job_id, quote["id"], "approved")
+                            MockDB.update_job_fields(job_id, status="approved")
+                            st.rerun()
+                    with col2:
+                        if st.button("❌ Decline", key=f"decline_{quote['id']}"):
+                            MockDB.set_quote_status(job_id, quote["id"], "declined")
+                            rerun_section()
+                st.text_area("Breakdown", quote["breakdown"], height=100, disabled=True, key=f"breakdown_{quote['id']}")
+                st.divider()
+    else:
+        st.info("No quotes submitted yet.")
+
+# Job room: details section
+@st.fragment
+@profiling.timed("section.details")
+def show_details_section(job_id: str):
+    job = MockDB.get_job_summary(job_id)
+    st.subheader("Job Details")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        job["category"] = st.selectbox(
+            "Category",
+            JOB_CATEGORIES,
+            index=JOB_CATEGORIES.index(job["category"]) if job.get("category") in JOB_CATEGORIES else JOB_CATEGORIES.index("Other")
+        )
+        job["priority"] = st.selectbox(
+            "Priority",
+            JOB_PRIORITIES,
+            index=JOB_PRIORITIES.index(job["priority"]) if job.get("priority") in JOB_PRIORITIES else JOB_PRIORITIES.index("medium")
+        )
+    with col2:
+        job["location"] = st.text_input("Location", job.get("location", ""))
+        if st.session_state.current_user.get("role") in ["technician", "admin"]:
+            job["assigned_tech"] = st.text_input("Assigned Technician", job.get("assigned_tech", ""))
+
+    job["description"] = st.text_area(
+        "Problem Description",
+        job.get("description", ""),
+        height=150,
+        placeholder="Describe the issue in detail..."
+    )
+
+    if st.button("Save Details", type="secondary"):
+        # Only the fields on the form: the cached summary rounds `created` to milliseconds
+        fields = ["category", "priority", "location", "description"]
+        if st.session_state.current_user.get("role") in ["technician", "admin"]:
+            fields.append("assigned_tech")
+        MockDB.update_job_fields(job_id, **{field: job[field] for field in fields})
+        st.success("Details updated!")
+
+    st.divider()
+    st.markdown("### 📊 Job Timeline")
+    milestones = MockDB.get_milestones(job_id)
+    timeline_data = [
+        ("Created", job.get("created")),
+        ("First Message", milestones["first_message"]),
+        ("First Photo", milestones["first_photo"]),
+        ("First Quote", milestones["first_quote"]),
+        ("Completed", milestones["completed"]),
+        ("Status Updated", datetime.now().isoformat())
+    ]
+
+    for event, timestamp in timeline_data:
+        if timestamp:
+            st.write(f"**{event}:** {timestamp[:16].replace('T', ' ')}")
+
 # Job room component
 def show_job_room(job_id: str):
-    job = MockDB.get_job(job_id)
+    job = MockDB.get_job_summary(job_id)
     if not job:
+        archived = MockDB.get_archived_job(job_id)
+        if archived:
+            show_archived_job_room(archived)
+            return
         st.error("Job not found")
         st.stop()
     
@@ -202,330 +751,646 @@ def show_job_room(job_id: str):
     with col1:
         st.title(f"🔧 Job #{job_id}")
     with col2:
-        status_colors = {
-            "open": "#FFA726",
-            "in_progress": "#29B6F6",
-            "quoted": "#9C27B0",
-            "approved": "#4CAF50",
-            "completed": "#66BB6A",
-            "cancelled": "#EF5350"
-        }
         status = st.selectbox(
             "Status",
-            list(status_colors.keys()),
-            index=list(status_colors.keys()).index(job.get("status", "open")),
+            JOB_STATUSES,
+            index=JOB_STATUSES.index(job["status"]) if job.get("status") in JOB_STATUSES else 0,
             key=f"status_{job_id}"
         )
         if status != job.get("status"):
             job["status"] = status
-            MockDB.save_job(job_id, job)
+            MockDB.update_job_fields(job_id, status=status)
     with col3:
         if st.button("Exit Job", type="secondary"):
             del st.query_params["job_id"]
             st.session_state.current_user = None
             st.rerun()
     
-    # Main layout
-    tab1, tab2, tab3, tab4 = st.tabs(["📷 Photos", "💬 Chat", "💰 Quotes", "ℹ️ Details"])
+    # Main layout: only the selected section runs, and each section is a fragment
+    # so its own widgets rerun just that section
+    sections = {
+        "📷 Photos": show_photos_section,
+        "💬 Chat": show_chat_section,
+        "💰 Quotes": show_quotes_section,
+        "ℹ️ Details": show_details_section,
+    }
+    section = st.radio(
+        "Section",
+        list(sections.keys()),
+        horizontal=True,
+        key=f"section_{job_id}",
+        label_visibility="collapsed"
+    )
+    sections[section](job_id)
+
+# Archived jobs are rehydrated from cold storage and shown read-only
+def show_archived_job_room(job: Dict):
+    job_id = job["id"]
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        st.title(f"🗄️ Job #{job_id}")
+        st.caption(
+            f"{job['status'].title()} · archived {job['archived'][:10]} · read-only"
+        )
+    with col2:
+        if st.button("Exit Job", type="secondary"):
+            del st.query_params["job_id"]
+            st.session_state.current_user = None
+            st.rerun()
     
-    with tab1:
-        st.subheader("Visual Documentation")
-        
-        # Upload section
-        with st.expander("📤 Add Photos/Video", expanded=False):
-            col1, col2 = st.columns(2)
-            with col1:
-                uploaded = st.file_uploader(
-                    "Upload photos",
-                    accept_multiple_files=True,
-                    type=["png", "jpg", "jpeg", "heic"],
-                    key=f"upload_{job_id}"
-                )
-            with col2:
-                video = st.file_uploader("Upload video", type=["mp4", "mov"])
-                if video:
-                    st.video(video.getvalue())
-            
-            if uploaded:
-                for file in uploaded:
-                    img = Image.open(file)
-                    # Compress image
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG', quality=85, optimize=True)
-                    job["photos"].append({
-                        "data": base64.b64encode(img_byte_arr.getvalue()).decode(),
-                        "timestamp": datetime.now().isoformat(),
-                        "uploaded_by": st.session_state.current_user.get("role", "unknown")
-                    })
-                MockDB.save_job(job_id, job)
-                st.success(f"Added {len(uploaded)} photo(s)")
-                st.rerun()
-        
-        # Display photos in grid
+    section = st.radio(
+        "Section",
+        ["📷 Photos", "💬 Chat", "💰 Quotes", "ℹ️ Details"],
+        horizontal=True,
+        key=f"section_{job_id}",
+        label_visibility="collapsed"
+    )
+    if section == "📷 Photos":
+        # Same as the live gallery: thumbnails only, newest first, paged
         if job["photos"]:
-            st.markdown(f"### 📸 Gallery ({len(job['photos'])} images)")
+            offset, limit = gallery_page(job_id, len(job["photos"]))
+            photos = job["photos"][::-1][offset:offset + limit]
             cols = st.columns(4)
-            for idx, photo in enumerate(job["photos"][-12:]):  # Show last 12
+            for idx, photo in enumerate(photos):
+                digest = photo.get("thumb_sha256") or photo.get("sha256")
                 with cols[idx % 4]:
-                    img_data = base64.b64decode(photo["data"])
-                    st.image(img_data, use_column_width=True)
-                    st.caption(f"Added by {photo['uploaded_by']}")
+                    if digest and get_blobs().exists(digest):
+                        st.image(get_blobs().path(digest), use_column_width=True)
+                        profiling.count("images_rendered")
+                    st.caption(f"Added by {photo.get('uploaded_by', 'unknown')}")
         else:
-            st.info("No photos uploaded yet. Add photos to help technicians understand the issue.")
-    
-    with tab2:
-        st.subheader("Live Collaboration")
-        
-        # Chat messages
-        chat_container = st.container(height=400)
-        with chat_container:
-            for msg in job.get("messages", []):
-                if msg.get("type") == "system":
-                    st.markdown(f"🔔 *{msg['text']}*")
-                else:
-                    col1, col2 = st.columns([0.9, 0.1])
-                    with col1:
-                        if msg.get("role") == "customer":
-                            st.markdown(f"""
-                            <div class='message-customer'>
-                                <strong>👤 Customer</strong> <small>{msg.get('time', '')}</small><br>
-                                {msg['text']}
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            st.markdown(f"""
-                            <div class='message-technician'>
-                                <strong>🔧 {msg.get('sender', 'Technician')}</strong> <small>{msg.get('time', '')}</small><br>
-                                {msg['text']}
-                            </div>
-                            """, unsafe_allow_html=True)
-        
-        # Chat input
-        col1, col2 = st.columns([4, 1])
+            st.info("No photos.")
+        show_videos(job_id, job["videos"])
+    elif section == "💬 Chat":
+        with st.container(height=400):
+            st.markdown(
+                "\n\n".join(
+                    message_html(m["id"], m.get("type"), m.get("role"), m.get("sender"), m.get("time"), m["text"])
+                    for m in job["messages"]
+                ) or "No messages.",
+                unsafe_allow_html=True
+            )
+    elif section == "💰 Quotes":
+        if job["quotes"]:
+            st.dataframe(
+                [
+                    {
+                        "Amount": q.get("amount"), "Status": q.get("status"), "Technician": q.get("technician"),
+                        "Timeline": q.get("timeline"), "Warranty": q.get("warranty"), "Created": (q.get("created") or "")[:10],
+                        "Breakdown": q.get("breakdown")
+                    }
+                    for q in reversed(job["quotes"])
+                ],
+                hide_index=True, use_container_width=True,
+                column_config={"Amount": st.column_config.NumberColumn(format="$%.2f")}
+            )
+        else:
+            st.info("No quotes.")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write(f"**Category:** {job.get('category') or 'Unknown'}")
+            st.write(f"**Priority:** {job.get('priority')}")
+        with col2:
+            st.write(f"**Location:** {job.get('location') or '—'}")
+            st.write(f"**Assigned Technician:** {job.get('assigned_tech') or '—'}")
+        st.text_area("Problem Description", job.get("description", ""), height=150, disabled=True)
+        st.markdown("### 📊 Job Timeline")
+        for event, timestamp in [("Created", job.get("created")), ("Completed", job.get("completed")), ("Archived", job["archived"])]:
+            if timestamp:
+                st.write(f"**{event}:** {timestamp[:16].replace('T', ' ')}")
+
+# Job search over descriptions, locations, emails, quotes and chat; ranked and paged by the index
+SEARCH_PAGE_SIZE = 10
+
+@st.fragment
+@profiling.timed("search")
+def show_job_search(key: str):
+    text = st.text_input(
+        "🔎 Search jobs", key=f"{key}_text",
+        placeholder="Description, address, customer email, quote or chat text"
+    )
+    if not text.strip():
+        return
+    page_key = f"{key}_page"
+    if st.session_state.get(f"{key}_last") != text:
+        st.session_state[f"{key}_last"] = text
+        st.session_state[page_key] = 0
+    page = st.session_state.get(page_key, 0)
+    results, total = MockDB.search_jobs(text, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    if not results:
+        st.info("No jobs match this search.")
+        return
+    st.caption(f"{total:,} matching job(s)")
+    for job in results:
+        col1, col2 = st.columns([5, 1])
         with col1:
-            message = st.text_input(
-                "Type your message...",
-                key=f"chat_input_{job_id}",
-                label_visibility="collapsed"
+            st.markdown(
+                f"**Job #{html.escape(job['id'])}** - {html.escape(job['category'] or 'Unknown')} · {job['status']}"
+                f"<br><small>{highlight(job['snippet'])}</small>",
+                unsafe_allow_html=True
             )
         with col2:
-            if st.button("Send", type="primary", use_container_width=True):
-                if message:
-                    msg = {
-                        "role": st.session_state.current_user.get("role", "unknown"),
-                        "text": message,
-                        "time": datetime.now().strftime("%I:%M %p"),
-                        "sender": st.session_state.current_user.get("email", ""),
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    job["messages"].append(msg)
-                    MockDB.save_job(job_id, job)
-                    st.rerun()
+            if st.button("Open", key=f"{key}_open_{job['id']}"):
+                st.query_params["job_id"] = job["id"]
+                st.rerun()
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("← Previous", key=f"{key}_prev", disabled=page == 0):
+                st.session_state[page_key] = page - 1
+                rerun_section()
+        with col2:
+            st.caption(f"Page {page + 1} of {pages}")
+        with col3:
+            if st.button("Next →", key=f"{key}_next", disabled=page + 1 >= pages):
+                st.session_state[page_key] = page + 1
+                rerun_section()
+
+# Admin job table: filtered, sorted and paged by the store; actions apply to selected rows
+@st.fragment
+@profiling.timed("admin.job_table")
+def show_admin_job_table():
+    st.subheader("All Jobs")
     
-    with tab3:
-        st.subheader("Quotes & Pricing")
-        
-        # Technician quote submission
-        if st.session_state.current_user.get("role") == "technician":
-            with st.expander("💵 Create New Quote", expanded=True):
-                col1, col2 = st.columns(2)
-                with col1:
-                    amount = st.number_input("Amount ($)", min_value=0.0, step=10.0)
-                    breakdown = st.text_area("Breakdown", placeholder="Labor: $200\nParts: $150\nTax: $35")
-                with col2:
-                    timeline = st.selectbox("Timeline", ["ASAP", "1-2 days", "3-5 days", "1 week+", "Custom"])
-                    warranty = st.selectbox("Warranty", ["30 days", "90 days", "1 year", "Lifetime"])
-                
-                if st.button("Submit Quote", type="primary", use_container_width=True):
-                    quote_id = str(uuid.uuid4())[:8]
-                    job["quotes"].append({
-                        "id": quote_id,
-                        "amount": amount,
-                        "breakdown": breakdown,
-                        "timeline": timeline,
-                        "warranty": warranty,
-                        "technician": st.session_state.current_user.get("email"),
-                        "created": datetime.now().isoformat(),
-                        "status": "pending"
-                    })
-                    job["messages"].append({
-                        "type": "system",
-                        "text": f"New quote submitted for ${amount}"
-                    })
-                    MockDB.save_job(job_id, job)
-                    st.success("Quote submitted!")
-                    st.rerun()
-        
-        # Display quotes
-        if job.get("quotes"):
-            for quote in reversed(job["quotes"]):
-                with st.container():
-                    st.markdown(f"""
-                    <div class='quote-card'>
-                        <h3>${quote['amount']:.2f}</h3>
-                        <p><strong>Timeline:</strong> {quote['timeline']}</p>
-                        <p><strong>Warranty:</strong> {quote['warranty']}</p>
-                        <p><strong>By:</strong> {quote['technician']}</p>
-                        <small>{quote['created'][:10]}</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    col1, col2 = st.columns(2)
-                    if st.session_state.current_user.get("role") == "customer":
-                        with col1:
-                            if st.button("✅ Approve", key=f"approve_{quote['id']}"):
-                                quote["status"] = "approved"
-                                job["status"] = "approved"
-                                MockDB.save_job(job_id, job)
-                                st.rerun()
-                        with col2:
-                            if st.button("❌ Decline", key=f"decline_{quote['id']}"):
-                                quote["status"] = "declined"
-                                MockDB.save_job(job_id, job)
-                                st.rerun()
-                    st.text_area("Breakdown", quote["breakdown"], height=100, disabled=True)
-                    st.divider()
-        else:
-            st.info("No quotes submitted yet.")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        statuses = st.multiselect("Status", JOB_STATUSES, key="admin_status")
+    with col2:
+        categories = st.multiselect("Category", JOB_CATEGORIES, key="admin_category")
+    with col3:
+        priorities = st.multiselect("Priority", JOB_PRIORITIES, key="admin_priority")
+    with col4:
+        dates = st.date_input("Created between", value=(), key="admin_dates")
     
-    with tab4:
-        st.subheader("Job Details")
-        
+    sort_options = {
+        "Newest first": ("created", True),
+        "Oldest first": ("created", False),
+        "Highest quote": ("max_quote", True),
+        "Most messages": ("message_count", True),
+    }
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_label = st.selectbox("Sort by", list(sort_options.keys()), key="admin_sort")
+    with col2:
+        page_size = st.selectbox("Rows per page", [25, 50, 100], index=1, key="admin_page_size")
+    
+    created_from = dates[0].isoformat() if len(dates) >= 1 else None
+    created_to = (dates[1] + timedelta(days=1)).isoformat() if len(dates) == 2 else None
+    sort, descending = sort_options[sort_label]
+    filters = dict(
+        status=statuses, category=categories, priority=priorities,
+        created_from=created_from, created_to=created_to
+    )
+    # Back to the first page whenever the filters or sort change
+    signature = repr((filters, sort, descending, page_size))
+    if st.session_state.get("admin_filters") != signature:
+        st.session_state.admin_filters = signature
+        st.session_state.admin_page = 1
+    total = MockDB.count_jobs(**filters)
+    pages = max(1, (total + page_size - 1) // page_size)
+    with col3:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="admin_page")
+    rows, total = MockDB.query_jobs(
+        limit=page_size, offset=(page - 1) * page_size, sort=sort, descending=descending, total=total, **filters
+    )
+    st.caption(f"{total:,} matching job(s)")
+    
+    if not rows:
+        st.info("No jobs match these filters.")
+        return
+    
+    table = [
+        {
+            "Job": r["id"],
+            "Status": r["status"],
+            "Category": r["category"] or "Unknown",
+            "Priority": r["priority"],
+            "Customer": r["customer_email"],
+            "Technician": r["assigned_tech"] or "",
+            "Created": (r["created"] or "")[:10],
+            "Photos": r["photo_count"],
+            "Messages": r["message_count"],
+            "Quotes": r["quote_count"],
+            "Highest Quote": r["max_quote"],
+        }
+        for r in rows
+    ]
+    event = st.dataframe(
+        table,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="multi-row",
+        key="admin_jobs_table"
+    )
+    selected = [rows[i] for i in event.selection.rows] if event else []
+    if not selected:
+        st.caption("Select rows to see details and apply actions.")
+        return
+    
+    selected_ids = [r["id"] for r in selected]
+    st.markdown(f"**{len(selected)} job(s) selected**")
+    for r in selected[:10]:
+        with st.expander(f"Job #{r['id']} - {r['category'] or 'Unknown'} - {r['status']}"):
+            st.write(f"**Location:** {r['location'] or 'N/A'}")
+            st.write(r["description"] or "_No description_")
+            if st.button("Open job room", key=f"admin_open_{r['id']}"):
+                st.query_params["job_id"] = r["id"]
+                st.rerun()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🗑️ Delete selected", key="admin_bulk_delete"):
+            MockDB.delete_jobs(selected_ids)
+            st.rerun()
+    with col2:
+        tech = st.text_input("Reassign to technician", key="admin_bulk_tech")
+        if st.button("👨‍🔧 Reassign selected", key="admin_bulk_reassign") and tech:
+            MockDB.update_jobs(selected_ids, assigned_tech=tech)
+            st.rerun()
+    with col3:
+        if st.button("✅ Close selected", key="admin_bulk_close"):
+            MockDB.update_jobs(selected_ids, status="completed")
+            st.rerun()
+
+# Revenue, approval and turnaround reporting over the analytics snapshot
+ANALYTICS_RANGES = {"Last 30 days": 30, "Last 90 days": 90, "Last year": 365, "All time": None}
+
+def format_hours(hours: float) -> str:
+    if hours != hours:
+        return "—"
+    return f"{hours:.1f} h" if hours < 48 else f"{hours / 24:.1f} d"
+
+@st.fragment
+@profiling.timed("analytics")
+def show_analytics():
+    col1, col2 = st.columns(2)
+    with col1:
+        period = st.selectbox("Jobs created", list(ANALYTICS_RANGES.keys()), index=1, key="analytics_range")
+    with col2:
+        freq = st.selectbox("Revenue by", ["Day", "Week", "Month"], index=1, key="analytics_freq")
+    days = ANALYTICS_RANGES[period]
+    since = pd.Timestamp.now().normalize() - pd.Timedelta(days=days) if days else None
+    jobs, quotes = get_analytics().snapshot()
+    data = report(jobs, quotes, since=since, freq=freq[0])
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Jobs", f"{data['jobs']:,}")
+    with col2:
+        st.metric("Revenue", f"${data['revenue']:,.2f}")
+    with col3:
+        rate = data["approval_rate"]
+        st.metric("Quote Approval Rate", "—" if rate != rate else f"{rate:.0%}")
+    with col4:
+        st.metric("Quotes", f"{data['quotes']:,}")
+    
+    st.markdown(f"#### Revenue by {freq.lower()}")
+    if len(data["revenue_by_period"]):
+        st.bar_chart(data["revenue_by_period"].rename("Revenue"))
+    else:
+        st.caption("No approved quotes in this range.")
+    
+    st.markdown("#### Turnaround")
+    turnaround = [
+        ("Time to first message", data["time_to_first_message"]),
+        ("Time to first quote", data["time_to_first_quote"]),
+        ("Open to completed", data["open_to_completed"]),
+    ]
+    st.dataframe(
+        [
+            {
+                "Milestone": label,
+                "Jobs": stats["jobs"],
+                "Median": format_hours(stats["median_h"]),
+                "90th percentile": format_hours(stats["p90_h"]),
+                "Mean": format_hours(stats["mean_h"]),
+            }
+            for label, stats in turnaround
+        ],
+        hide_index=True, use_container_width=True
+    )
+    
+    col1, col2 = st.columns(2)
+    for col, key, label in [(col1, "by_category", "Category"), (col2, "by_technician", "Technician")]:
+        with col:
+            st.markdown(f"#### By {label.lower()}")
+            table = data[key].reset_index().rename(columns={
+                "key": label, "quotes": "Quotes", "approved": "Approved",
+                "revenue": "Revenue", "approval_rate": "Approval Rate"
+            })
+            st.dataframe(
+                table[[label, "Quotes", "Approved", "Revenue", "Approval Rate"]],
+                hide_index=True, use_container_width=True,
+                column_config={
+                    "Revenue": st.column_config.NumberColumn(format="$%.2f"),
+                    "Approval Rate": st.column_config.NumberColumn(format="percent"),
+                }
+            )
+
+# Render and data-call timings for this server process, from the profiling spans
+def show_performance_panel():
+    with st.expander("⏱️ Performance"):
+        enabled = st.toggle("Profiling", value=profiling.enabled(), key="profiling_enabled")
+        if enabled != profiling.enabled():
+            profiling.set_enabled(enabled)
+        spans, counters = profiling.snapshot()
+        pages = sorted({row["page"] for row in spans})
+        page = st.selectbox("Page", ["All"] + pages, key="profiling_page")
+        rows = [
+            {
+                "Page": row["page"],
+                "Span": row["span"],
+                "Calls": row["count"],
+                "Total (ms)": round(row["total_ms"], 1),
+                "Mean (ms)": round(row["mean_ms"], 2),
+                "p50 (ms)": round(row["p50_ms"], 2),
+                "p95 (ms)": round(row["p95_ms"], 2),
+                "Max (ms)": round(row["max_ms"], 2),
+            }
+            for row in spans if page == "All" or row["page"] == page
+        ]
+        if rows:
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No spans recorded yet.")
+        if counters:
+            st.dataframe(
+                [{"Counter": c["counter"], "Page": c["page"], "Value": c["value"]} for c in counters],
+                hide_index=True, use_container_width=True
+            )
         col1, col2 = st.columns(2)
         with col1:
-            job["category"] = st.selectbox(
-                "Category",
-                ["Plumbing", "Electrical", "HVAC", "Appliance", "Structural", "Other"],
-                index=["Plumbing", "Electrical", "HVAC", "Appliance", "Structural", "Other"].index(job.get("category", "Other")) if job.get("category") in ["Plumbing", "Electrical", "HVAC", "Appliance", "Structural", "Other"] else 5
+            st.download_button(
+                "⬇️ Prometheus metrics", profiling.prometheus_text(),
+                file_name="fixsync.prom", mime="text/plain", key="profiling_download"
             )
-            job["priority"] = st.selectbox(
-                "Priority",
-                ["low", "medium", "high", "emergency"],
-                index=["low", "medium", "high", "emergency"].index(job.get("priority", "medium"))
+        with col2:
+            if st.button("Reset", key="profiling_reset"):
+                profiling.reset()
+                st.rerun()
+        st.caption(f"Percentiles are histogram bucket bounds. Also written to {profiling.METRICS_FILE} every {profiling.EXPORT_INTERVAL:g} s.")
+
+def show_transfer_panel():
+    with st.expander("💾 Export / Import"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Export**")
+            parquet = st.checkbox(
+                "Also write Parquet", key="export_parquet", disabled=not PARQUET_SUPPORTED,
+                help=None if PARQUET_SUPPORTED else "Install pyarrow to enable Parquet export"
             )
+            if st.button("Export all jobs", key="export_run"):
+                path = os.path.join(EXPORT_DIR, f"fixsync-{datetime.now():%Y%m%d-%H%M%S}")
+                os.makedirs(path, exist_ok=True)
+                bar = st.progress(0.0, text="Exporting...")
+                manifest = export_jobs(
+                    get_store(), path, blobs=get_blobs(), parquet=parquet,
+                    progress=lambda name, done, total: bar.progress(done / max(total, 1), text=f"Exporting {name}: {done:,}/{total:,}")
+                )
+                bar.empty()
+                st.success(f"Exported to {path}")
+                st.caption(", ".join(f"{n:,} {name}" for name, n in manifest["counts"].items()) + f", {manifest['media']:,} media files")
+                if manifest["missing_media"]:
+                    st.warning(f"{manifest['missing_media']:,} referenced media files were missing from the blob store.")
         with col2:
-            job["location"] = st.text_input("Location", job.get("location", ""))
-            if st.session_state.current_user.get("role") in ["technician", "admin"]:
-                job["assigned_tech"] = st.text_input("Assigned Technician", job.get("assigned_tech", ""))
-        
-        job["description"] = st.text_area(
-            "Problem Description",
-            job.get("description", ""),
-            height=150,
-            placeholder="Describe the issue in detail..."
+            st.markdown("**Import**")
+            path = st.text_input("Export directory (on the server)", key="import_path")
+            if path:
+                try:
+                    status = import_status(get_store(), path)
+                except ValueError as e:
+                    st.error(str(e))
+                    return
+                if status and all(s["done"] for s in status.values()):
+                    st.caption("This export has already been imported.")
+                elif status:
+                    st.caption("Resumes a partial import: " + ", ".join(f"{s['rows']:,} {name}" for name, s in status.items()))
+                if st.button("Import", key="import_run"):
+                    bar = st.progress(0.0, text="Importing...")
+                    inserted = import_jobs(
+                        get_store(), path, blobs=get_blobs(),
+                        progress=lambda name, done, total: bar.progress(min(done / max(total, 1), 1.0), text=f"Importing {name}: {done:,}/{total:,}")
+                    )
+                    bar.empty()
+                    st.success("Imported " + ", ".join(f"{n:,} {name}" for name, n in inserted.items()))
+        st.caption(f"Exports are written under {EXPORT_DIR}. Also available as `python transfer.py export|import <dir>`.")
+
+def show_archive_panel():
+    with st.expander("🗄️ Archive"):
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            days = st.number_input(
+                "Archive completed and cancelled jobs closed more than N days ago",
+                min_value=0, value=ARCHIVE_AFTER_DAYS, key="archive_days"
+            )
+        with col2:
+            if st.button("Archive now", key="archive_run"):
+                with st.spinner("Archiving..."):
+                    archived = get_archive().archive(int(days))
+                st.success(f"Archived {archived:,} job(s)")
+        job_id = st.text_input("Open an archived job by ID", key="archive_open_id")
+        if job_id and st.button("Open", key="archive_open"):
+            if MockDB.get_archived_job(job_id.strip()):
+                st.query_params["job_id"] = job_id.strip()
+                st.rerun()
+            else:
+                st.error("No archived job with that ID")
+        stats = get_archive().stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Archived Jobs", f"{stats['jobs']:,}")
+        with col2:
+            st.metric("Segments", stats["segments"])
+        with col3:
+            st.metric("On Disk", f"{stats['disk_bytes'] / 1e6:.1f} MB")
+        st.caption(f"Segments are {stats['codec']}-compressed. Dashboard totals include archived jobs. Also runnable as `python archive.py --days N`.")
+
+def show_notifications_panel():
+    with st.expander("🔔 Notifications"):
+        notifier = get_notifier()
+        stats = notifier.stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Pending", f"{stats['pending']:,}")
+        with col2:
+            st.metric("Sent", f"{stats['sent']:,}")
+        with col3:
+            st.metric("Failed", f"{stats['failed']:,}")
+        failures = notifier.failures()
+        if failures:
+            st.dataframe(
+                [
+                    {"Recipient": f["recipient"], "Channel": f["channel"], "Notification": f["text"],
+                     "Attempts": f["attempts"], "State": f["state"], "Error": f["error"]}
+                    for f in failures
+                ],
+                hide_index=True, use_container_width=True
+            )
+        if stats["failed"] and st.button("Retry failed", key="notify_retry"):
+            st.success(f"Requeued {notifier.retry_failed():,} notification(s)")
+        st.caption(
+            f"Channels: {', '.join(f'{name} ({type(c).__name__})' for name, c in notifier.channels.items())}. "
+            f"Updates to the same person are held {notifier.coalesce_seconds:g} s and sent as one digest."
         )
-        
-        if st.button("Save Details", type="secondary"):
-            MockDB.save_job(job_id, job)
-            st.success("Details updated!")
-        
-        st.divider()
-        st.markdown("### 📊 Job Timeline")
-        timeline_data = [
-            ("Created", job.get("created")),
-            ("First Message", job.get("messages")[0]["timestamp"] if job.get("messages") else None),
-            ("First Photo", job.get("photos")[0]["timestamp"] if job.get("photos") else None),
-            ("First Quote", job.get("quotes")[0]["created"] if job.get("quotes") else None),
-            ("Status Updated", datetime.now().isoformat())
-        ]
-        
-        for event, timestamp in timeline_data:
-            if timestamp:
-                st.write(f"**{event}:** {timestamp[:16].replace('T', ' ')}")
 
 # Admin dashboard
 def show_admin_dashboard():
     st.title("👑 Admin Dashboard")
     
-    jobs = MockDB.get_all_jobs()
-    
+    # Tiles read materialized counters that every write keeps up to date
+    totals = MockDB.get_metrics("all").get("", {})
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Jobs", len(jobs))
+        st.metric("Total Jobs", int(totals.get("jobs", 0)))
     with col2:
-        open_jobs = sum(1 for j in jobs.values() if j.get("status") == "open")
-        st.metric("Open Jobs", open_jobs)
+        st.metric("Open Jobs", int(totals.get("status:open", 0)))
     with col3:
-        revenue = sum(q["amount"] for j in jobs.values() for q in j.get("quotes", []) if q.get("status") == "approved")
-        st.metric("Total Revenue", f"${revenue:,.2f}")
+        st.metric("Total Revenue", f"${totals.get('revenue', 0):,.2f}")
+    
+    with st.expander("📈 Breakdown by category and technician"):
+        col1, col2 = st.columns(2)
+        for col, scope, label in [(col1, "category", "Category"), (col2, "tech", "Technician")]:
+            with col:
+                rows = [
+                    {
+                        label: key or "—",
+                        "Jobs": int(m.get("jobs", 0)),
+                        "Open": int(m.get("status:open", 0)),
+                        "Approved Quotes": int(m.get("approved_quotes", 0)),
+                        "Revenue": m.get("revenue", 0.0)
+                    }
+                    for key, m in sorted(MockDB.get_metrics(scope).items())
+                ]
+                st.dataframe(rows, hide_index=True, use_container_width=True)
+        if st.button("Verify metrics", key="verify_metrics"):
+            drift = MockDB.check_metrics()
+            if drift:
+                MockDB.rebuild_metrics()
+                st.warning(f"Rebuilt metrics; {len(drift)} counter(s) had drifted.")
+            else:
+                st.success("All metrics match a full recomputation.")
+        cache = get_job_cache().stats()
+        st.caption(
+            f"Job cache (this server process): {cache['entries']} entries · {cache['hits']:,} hits · "
+            f"{cache['misses']:,} misses · {cache['evictions']:,} evictions · {cache['invalidations']:,} invalidations"
+        )
+    
+    show_performance_panel()
+    show_transfer_panel()
+    show_archive_panel()
+    show_notifications_panel()
     
     st.divider()
     
-    # Jobs table
-    st.subheader("All Jobs")
-    for job_id, job in jobs.items():
-        with st.expander(f"Job #{job_id} - {job.get('category', 'Unknown')} - {job.get('status', 'unknown')}"):
-            col1, col2, col3 = st.columns(3)
+    view = st.radio(
+        "View", ["📋 Jobs", "📊 Analytics"], horizontal=True,
+        key="admin_view", label_visibility="collapsed"
+    )
+    if view == "📊 Analytics":
+        show_analytics()
+    else:
+        show_job_search("admin_search")
+        show_admin_job_table()
+
+# Dashboard for technicians
+def show_tech_dashboard():
+    st.title("👨‍🔧 Technician Dashboard")
+    st.write(f"Welcome, {st.session_state.current_user.get('email', 'Technician')}!")
+    
+    show_job_search("tech_search")
+    
+    my_jobs = MockDB.find_jobs(assigned_tech=st.session_state.current_user.get("email"))
+    
+    if my_jobs:
+        st.subheader("Your Assigned Jobs")
+        for job in my_jobs:
+            with st.container():
+                col1, col2, col3 = st.columns([3, 1, 1])
+                with col1:
+                    st.write(f"**Job #{job['id']}** - {job.get('category', 'Unknown')}")
+                    st.write(f"Customer: {job.get('customer_email', 'N/A')}")
+                with col2:
+                    st.write(f"Status: {job.get('status', 'unknown')}")
+                with col3:
+                    if st.button("Open", key=f"open_{job['id']}"):
+                        st.query_params["job_id"] = job['id']
+                        st.rerun()
+                st.divider()
+    else:
+        st.info("No jobs assigned to you yet.")
+    
+    archived = MockDB.find_archived_jobs(assigned_tech=st.session_state.current_user.get("email"))
+    if archived:
+        with st.expander(f"🗄️ Archived jobs ({len(archived)})"):
+            for job in archived:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(f"**Job #{job['id']}** - {job.get('category') or 'Unknown'} · {job['status']} · archived {job['archived'][:10]}")
+                with col2:
+                    if st.button("Open", key=f"open_archived_{job['id']}"):
+                        st.query_params["job_id"] = job["id"]
+                        st.rerun()
+    
+    # Dispatch queue: priority then age; claims are compare-and-set in the store
+    st.subheader("Dispatch Queue")
+    tech_email = st.session_state.current_user.get("email")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        category = st.selectbox("Category", ["All"] + JOB_CATEGORIES, key="dispatch_category")
+    category = None if category == "All" else category
+    with col2:
+        if st.button("⚡ Take next job", type="primary", use_container_width=True):
+            job_id = MockDB.claim_next(tech_email, category)
+            if job_id:
+                st.query_params["job_id"] = job_id
+                st.rerun()
+            else:
+                st.info("The queue is empty.")
+    
+    priority_icons = {"emergency": "🚨", "high": "🔴", "medium": "🟠", "low": "🟢"}
+    open_jobs = MockDB.dispatch_queue(category)
+    if not open_jobs:
+        st.info("No open jobs waiting.")
+    for job in open_jobs:
+        with st.container():
+            col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
-                st.write(f"**Customer:** {job.get('customer_email', 'N/A')}")
-                st.write(f"**Created:** {job.get('created', '')[:10]}")
+                st.write(f"{priority_icons.get(job['priority'], '')} **Job #{job['id']}** - {job.get('category') or 'Unknown'}")
+                st.caption(f"{job['priority'].title()} · opened {(job['created'] or '')[:16].replace('T', ' ')}")
             with col2:
-                st.write(f"**Photos:** {len(job.get('photos', []))}")
-                st.write(f"**Messages:** {len(job.get('messages', []))}")
+                st.write(f"Photos: {job['photo_count']}")
             with col3:
-                st.write(f"**Quotes:** {len(job.get('quotes', []))}")
-                if job.get("quotes"):
-                    st.write(f"**Highest Quote:** ${max(q.get('amount', 0) for q in job['quotes']):.2f}")
-            
-            if st.button(f"Delete Job #{job_id}", type="secondary", key=f"delete_{job_id}"):
-                del st.session_state.jobs[job_id]
-                st.rerun()
+                if st.button("Claim Job", key=f"claim_{job['id']}"):
+                    if MockDB.claim_job(job["id"], tech_email):
+                        st.rerun()
+                    else:
+                        st.warning(f"Job #{job['id']} was just claimed by someone else.")
+            st.divider()
 
 # Main app logic
 def main():
+    get_notifier()
+    
     # Check if user is authenticated
     if st.session_state.current_user is None and "job_id" not in st.query_params:
-        show_auth()
+        with profiling.page("auth"):
+            show_auth()
         return
     
     # Check if in job room
     if "job_id" in st.query_params:
-        job_id = st.query_params["job_id"][0]
-        show_job_room(job_id)
+        job_id = st.query_params["job_id"]
+        with profiling.page("job_room"):
+            show_job_room(job_id)
     elif st.session_state.current_user and st.session_state.current_user.get("role") == "admin":
-        show_admin_dashboard()
+        with profiling.page("admin"):
+            show_admin_dashboard()
     else:
-        # Dashboard for technicians
-        st.title("👨‍🔧 Technician Dashboard")
-        st.write(f"Welcome, {st.session_state.current_user.get('email', 'Technician')}!")
-        
-        jobs = MockDB.get_all_jobs()
-        my_jobs = [j for j in jobs.values() if j.get("assigned_tech") == st.session_state.current_user.get("email")]
-        
-        if my_jobs:
-            st.subheader("Your Assigned Jobs")
-            for job in my_jobs:
-                with st.container():
-                    col1, col2, col3 = st.columns([3, 1, 1])
-                    with col1:
-                        st.write(f"**Job #{job['id']}** - {job.get('category', 'Unknown')}")
-                        st.write(f"Customer: {job.get('customer_email', 'N/A')}")
-                    with col2:
-                        st.write(f"Status: {job.get('status', 'unknown')}")
-                    with col3:
-                        if st.button("Open", key=f"open_{job['id']}"):
-                            st.query_params["job_id"] = job['id']
-                            st.rerun()
-                    st.divider()
-        else:
-            st.info("No jobs assigned to you yet.")
-        
-        st.subheader("All Open Jobs")
-        open_jobs = [j for j in jobs.values() if j.get("status") == "open"]
-        for job in open_jobs:
-            with st.container():
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.write(f"**Job #{job['id']}** - {job.get('category', 'Unknown')}")
-                with col2:
-                    st.write(f"Photos: {len(job.get('photos', []))}")
-                with col3:
-                    if st.button("Claim Job", key=f"claim_{job['id']}"):
-                        job["assigned_tech"] = st.session_state.current_user.get("email")
-                        job["status"] = "in_progress"
-                        MockDB.save_job(job["id"], job)
-                        st.rerun()
-                st.divider()
+        with profiling.page("technician"):
+            show_tech_dashboard()
 
 # Run the app
 if __name__ == "__main__":
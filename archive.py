@@ -0,0 +1,355 @@
+"""Cold storage for closed jobs.
+
+Jobs completed or cancelled more than ARCHIVE_AFTER_DAYS ago are moved out of the live
+tables into append-only segment files under ARCHIVE_DIR. Each job becomes one
+compressed frame (its row, messages, quotes, photos and videos as JSON), located
+through the `archived_jobs` index table, so the job room can rehydrate a single job
+on demand without reading the rest of its segment. Media stays in the blob store,
+referenced by hash as before.
+
+Archiving moves each job's contribution to the dashboard metrics from `metrics`
+into `archive_rollups`, and JobStore.get_metrics adds the two together, so the admin
+tiles still count archived jobs without ever scanning them. Likewise each job's quotes
+and first-message/first-quote times stay in `archived_quotes` and `archived_jobs` for
+the analytics view.
+
+Frames are zstd-compressed when the `zstandard` package is installed and
+zlib-compressed otherwise; the codec is recorded per job, so both can be read back.
+
+    python archive.py [--days 90]
+"""
+import argparse
+import json
+import os
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+try:
+    # Optional: better ratio and faster decompression than zlib
+    import zstandard
+    ZSTD_SUPPORTED = True
+except ImportError:
+    ZSTD_SUPPORTED = False
+
+from storage import DATA_DIR, JobStore
+
+ARCHIVE_DIR = os.environ.get("FIXSYNC_ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("FIXSYNC_ARCHIVE_AFTER_DAYS", "90"))
+CLOSED_STATUSES = ("completed", "cancelled")
+
+# A new segment file is started once the current one passes this size
+SEGMENT_BYTES = 64 * 1024 * 1024
+BATCH_SIZE = 100
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+
+# Index columns copied from the job row, enough to list archived jobs without reading them
+INDEX_COLUMNS = ["id", "customer_email", "status", "assigned_tech", "priority", "category", "created", "completed"]
+# Read from the frame, for analytics (see analytics.py)
+MILESTONE_COLUMNS = ["first_message", "first_quote"]
+ARCHIVED_QUOTE_COLUMNS = ["id", "amount", "status", "technician", "created"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived_jobs (
+    id TEXT PRIMARY KEY,
+    customer_email TEXT,
+    status TEXT NOT NULL,
+    assigned_tech TEXT,
+    priority TEXT,
+    category TEXT,
+    created TEXT,
+    completed TEXT,
+    first_message TEXT,
+    first_quote TEXT,
+    archived TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    codec TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archived_jobs_customer ON archived_jobs(customer_email);
+CREATE INDEX IF NOT EXISTS idx_archived_jobs_tech ON archived_jobs(assigned_tech);
+
+-- Quotes of archived jobs, for analytics
+CREATE TABLE IF NOT EXISTS archived_quotes (
+    job_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    amount REAL,
+    status TEXT,
+    technician TEXT,
+    created TEXT,
+    PRIMARY KEY (job_id, id)
+);
+
+-- Content types of archived videos, for the media server (the videos rows are gone)
+CREATE TABLE IF NOT EXISTS archived_media (
+    sha256 TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL
+);
+
+-- Metrics of archived jobs, in the same shape as the metrics table
+CREATE TABLE IF NOT EXISTS archive_rollups (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key, name)
+);
+"""
+
+
+def compress(data: bytes) -> tuple:
+    """(codec, frame) with the best codec available."""
+    if ZSTD_SUPPORTED:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL, write_checksum=True).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec: str, frame: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(frame)
+    if codec == "zstd":
+        if not ZSTD_SUPPORTED:
+            raise RuntimeError("this job was archived with zstd; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    raise ValueError(f"unknown archive codec {codec!r}")
+
+
+# Frames never change once written, so recently opened jobs are kept decompressed
+@lru_cache(maxsize=64)
+def _read_frame(path: str, offset: int, length: int, codec: str) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    if len(frame) != length:
+        raise ValueError(f"archive segment {path} is truncated")
+    return decompress(codec, frame)
+
+
+class ColdStore:
+    def __init__(self, store: JobStore, root: str = ARCHIVE_DIR):
+        self.store = store
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        conn = store.conn
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(archived_jobs)")}
+        with store._tx():
+            for column in MILESTONE_COLUMNS:
+                if columns and column not in columns:
+                    conn.execute(f"ALTER TABLE archived_jobs ADD COLUMN {column} TEXT")
+        conn.executescript(SCHEMA)
+        if columns and not {"archived_media", "archived_quotes"} <= tables:
+            self._index_frames()
+        store.archive = self
+
+    def _index_frames(self):
+        """Fill the tables derived from frames for jobs archived before they existed."""
+        rows = self.store.conn.execute("SELECT id FROM archived_jobs").fetchall()
+        with self.store._tx() as conn:
+            for row in rows:
+                self._index_job(conn, self.get(row["id"]))
+
+    @staticmethod
+    def _index_job(conn, job: Dict):
+        """Record what is looked up without opening the frame: video content types
+        for the media server, and quotes and milestones for analytics."""
+        conn.executemany(
+            "INSERT OR IGNORE INTO archived_media (sha256, content_type) VALUES (?, ?)",
+            [(video["sha256"], video["content_type"]) for video in job.get("videos", [])
+             if video.get("sha256") and video.get("content_type")],
+        )
+        conn.execute("DELETE FROM archived_quotes WHERE job_id = ?", (job["id"],))
+        conn.executemany(
+            f"INSERT INTO archived_quotes (job_id, {', '.join(ARCHIVED_QUOTE_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(ARCHIVED_QUOTE_COLUMNS))})",
+            [[job["id"]] + [quote.get(col) for col in ARCHIVED_QUOTE_COLUMNS] for quote in job.get("quotes", [])],
+        )
+        # The same milestones the job room's timeline and analytics.JOBS_SQL use
+        conn.execute(
+            "UPDATE archived_jobs SET first_message = ?, first_quote = ? WHERE id = ?",
+            (
+                next((m["timestamp"] for m in job.get("messages", []) if m.get("timestamp")), None),
+                job["quotes"][0].get("created") if job.get("quotes") else None,
+                job["id"],
+            ),
+        )
+
+    def _segment(self) -> str:
+        """Name of the segment to append to: the newest one, unless it is full."""
+        names = sorted(n for n in os.listdir(self.root) if n.endswith(".seg"))
+        if names and os.path.getsize(os.path.join(self.root, names[-1])) < SEGMENT_BYTES:
+            return names[-1]
+        number = int(names[-1].split(".")[0]) + 1 if names else 1
+        return f"{number:06d}.seg"
+
+    def _candidates(self, cutoff: str, limit: int) -> List[str]:
+        rows = self.store.conn.execute(
+            f"SELECT id FROM jobs WHERE status IN ({', '.join('?' * len(CLOSED_STATUSES))}) "
+            "AND closed < ? ORDER BY closed LIMIT ?",
+            (*CLOSED_STATUSES, cutoff, limit),
+        )
+        return [row[0] for row in rows]
+
+    def _payloads(self, job_ids: List[str]) -> Dict[str, tuple]:
+        """{job_id: (version, index values, codec, frame, job dict)}, read outside the write lock."""
+        conn = self.store.conn
+        rows = conn.execute(
+            f"SELECT * FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", job_ids
+        ).fetchall()
+        jobs = self.store._assemble(rows)
+        out = {}
+        for row in rows:
+            job = jobs[row["id"]]
+            job["completed"] = row["completed"]
+            job["closed"] = row["closed"]
+            job["videos"] = self.store.get_videos(row["id"])
+            for photo in job["photos"]:
+                # Legacy inline data is already in the blob store once sha256 is set
+                if photo.get("sha256"):
+                    photo.pop("data", None)
+            codec, frame = compress(json.dumps(job, ensure_ascii=False, separators=(",", ":")).encode())
+            out[row["id"]] = (
+                row["version"], {col: row[col] for col in INDEX_COLUMNS}, codec, frame, job
+            )
+        return out
+
+    def archive(self, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE,
+                now: Optional[datetime] = None) -> int:
+        """Move jobs closed (completed or cancelled) more than `older_than_days` ago to cold storage.
+        Returns the number of jobs archived."""
+        cutoff = ((now or datetime.now()) - timedelta(days=older_than_days)).isoformat()
+        archived = 0
+        while True:
+            job_ids = self._candidates(cutoff, batch_size)
+            if not job_ids:
+                return archived
+            archived += self.move(job_ids)
+
+    def move(self, job_ids: List[str]) -> int:
+        """Move these live jobs to cold storage now, whatever their status or age.
+        Jobs changed while being written out are left live; returns the number moved."""
+        payloads = self._payloads(job_ids)
+        with self.store._tx() as conn:
+            # Skip jobs changed since they were read; the next pass picks them up again
+            current = {
+                row["id"]: row["version"] for row in conn.execute(
+                    f"SELECT id, version FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", job_ids
+                )
+            }
+            ready = [job_id for job_id, p in payloads.items() if current.get(job_id) == p[0]]
+            if not ready:
+                return 0
+            # Appending under the write lock keeps concurrent archivers from interleaving.
+            # Frames written by a transaction that then rolls back are never indexed.
+            segment = self._segment()
+            locations = {}
+            with open(os.path.join(self.root, segment), "ab") as f:
+                f.seek(0, os.SEEK_END)
+                for job_id in ready:
+                    locations[job_id] = f.tell()
+                    f.write(payloads[job_id][3])
+                f.flush()
+                os.fsync(f.fileno())
+            stamp = datetime.now().isoformat()
+            for job_id in ready:
+                _, index, codec, frame, job = payloads[job_id]
+                with self.store._job_tx(job_id):
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO archived_jobs ({', '.join(INDEX_COLUMNS)}, archived, segment, offset, length, codec) "
+                        f"VALUES ({', '.join(':' + c for c in INDEX_COLUMNS)}, :archived, :segment, :offset, :length, :codec)",
+                        {**index, "archived": stamp, "segment": segment, "offset": locations[job_id],
+                         "length": len(frame), "codec": codec},
+                    )
+                    # The job's metrics leave the live table (via _job_tx) and land in the rollups
+                    for (scope, key, name), value in self.store._metrics_for_job(conn, job_id).items():
+                        conn.execute(
+                            "INSERT INTO archive_rollups (scope, key, name, value) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT(scope, key, name) DO UPDATE SET value = value + excluded.value",
+                            (scope, key, name, value),
+                        )
+                    self._index_job(conn, job)
+                    self.store._publish(job_id, "archived")
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(ready)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """The archived job as a full job dict (plus `videos`, `completed` and
+        `archived`), or None if it is not archived."""
+        row = self.store.conn.execute("SELECT * FROM archived_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        data = _read_frame(os.path.join(self.root, row["segment"]), row["offset"], row["length"], row["codec"])
+        job = json.loads(data)
+        job["archived"] = row["archived"]
+        return job
+
+    def media_content_type(self, digest: str) -> Optional[str]:
+        row = self.store.conn.execute(
+            "SELECT content_type FROM archived_media WHERE sha256 = ?", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find(self, customer_email: Optional[str] = None, assigned_tech: Optional[str] = None,
+             limit: int = 50) -> List[Dict]:
+        """Index rows of archived jobs, most recently created first."""
+        where, params = [], []
+        if customer_email is not None:
+            where.append("customer_email = ?")
+            params.append(customer_email)
+        if assigned_tech is not None:
+            where.append("assigned_tech = ?")
+            params.append(assigned_tech)
+        rows = self.store.conn.execute(
+            "SELECT * FROM archived_jobs" + (f" WHERE {' AND '.join(where)}" if where else "")
+            + " ORDER BY created DESC LIMIT ?",
+            params + [limit],
+        )
+        return [{col: row[col] for col in INDEX_COLUMNS + ["archived"]} for row in rows]
+
+    def rollups(self, scope: str = "all") -> Dict[str, Dict[str, float]]:
+        out: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for row in self.store.conn.execute(
+            "SELECT key, name, value FROM archive_rollups WHERE scope = ? AND value != 0", (scope,)
+        ):
+            out[row["key"]][row["name"]] = row["value"]
+        return dict(out)
+
+    def stats(self) -> Dict:
+        row = self.store.conn.execute(
+            "SELECT COUNT(*) AS jobs, COALESCE(SUM(length), 0) AS bytes FROM archived_jobs"
+        ).fetchone()
+        segments = [n for n in os.listdir(self.root) if n.endswith(".seg")]
+        return {
+            "jobs": row["jobs"],
+            "bytes": row["bytes"],
+            "segments": len(segments),
+            "disk_bytes": sum(os.path.getsize(os.path.join(self.root, n)) for n in segments),
+            "codec": "zstd" if ZSTD_SUPPORTED else "zlib",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive jobs closed more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from events import EventBus
+    from search import SearchIndex
+
+    store = JobStore()
+    EventBus(store)
+    SearchIndex(store)
+    cold = ColdStore(store)
+    archived = cold.archive(args.days, args.batch_size)
+    stats = cold.stats()
+    print(f"Archived {archived:,} job(s); {stats['jobs']:,} in cold storage, {stats['disk_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Headless benchmark: seeds a synthetic dataset and replays user journeys through the
+real app.py with Streamlit's AppTest, recording rerun latency, peak memory and store
+calls. Results are compared against a JSON baseline and regressions are flagged.
+
+    python bench.py --jobs 500 --photos 4 --messages 30 --quotes 2
+    python bench.py --update-baseline      # accept the current numbers
+
+AppTest cannot drive st.file_uploader, so the customer journey uploads photos through
+the same ingest_image() call the uploader uses and then views the gallery.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, "app.py")
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+WORDS = (
+    "leak pipe drain heater furnace breaker outlet wire fan duct roof crack water gas "
+    "valve pump filter sink toilet faucet thermostat compressor panel switch"
+).split()
+CATEGORIES = ["Plumbing", "Electrical", "HVAC", "Appliance", "Structural", "Other"]
+PRIORITIES = ["low", "medium", "high", "emergency"]
+
+
+def _text(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _image(rng: random.Random) -> bytes:
+    from PIL import Image
+    img = Image.new("RGB", (1600, 1200), tuple(rng.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def seed(store, blob_root: str, jobs: int, photos: int, messages: int, quotes: int, rng: random.Random):
+    """N jobs, each with M photos (a few distinct images, deduplicated by hash), K chat
+    messages and Q quotes, spread over the past year."""
+    from media import ingest_image
+    images = [ingest_image(_image(rng), blob_root) for _ in range(min(photos, 4))]
+    now = datetime.now()
+    for i in range(jobs):
+        job_id = f"B{i:06d}"
+        created = now - timedelta(days=rng.uniform(0, 365))
+        store.save_job(job_id, {
+            "id": job_id,
+            "customer_email": f"customer{i % 97}@example.com",
+            "created": created.isoformat(),
+            "status": rng.choice(["open", "open", "in_progress", "quoted", "completed"]),
+            "assigned_tech": rng.choice([None, "tech1@example.com", "tech2@example.com"]),
+            "priority": rng.choice(PRIORITIES),
+            "category": rng.choice(CATEGORIES),
+            "location": f"{rng.randrange(1, 999)} {rng.choice(['Oak', 'Elm', 'Main'])} St",
+            "description": _text(rng, 15),
+            "messages": [
+                {
+                    "role": rng.choice(["customer", "technician"]),
+                    "text": _text(rng, 12),
+                    "sender": "bench",
+                    "time": (created + timedelta(minutes=k)).strftime("%I:%M %p"),
+                    "timestamp": (created + timedelta(minutes=k)).isoformat(),
+                }
+                for k in range(messages)
+            ],
+            "photos": [
+                {**images[k % len(images)], "timestamp": created.isoformat(), "uploaded_by": "customer"}
+                for k in range(photos)
+            ] if images else [],
+            "quotes": [
+                {
+                    "id": f"q{k}",
+                    "amount": round(rng.uniform(50, 2000), 2),
+                    "breakdown": _text(rng, 8),
+                    "timeline": "1-2 days",
+                    "warranty": "90 days",
+                    "technician": "tech1@example.com",
+                    "created": (created + timedelta(hours=k + 1)).isoformat(),
+                    "status": rng.choice(["pending", "approved", "declined"]),
+                }
+                for k in range(quotes)
+            ],
+        })
+
+
+class Recorder:
+    """Times every AppTest rerun of a journey and fails loudly on script exceptions."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def step(self, journey: str, at, action: Callable = None):
+        start = time.perf_counter()
+        (action(at) if action else at).run()
+        self.latencies[journey].append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{journey}: {at.exception[0].message}")
+        return at
+
+
+def _app(**session):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=120)
+    for key, value in session.items():
+        at.session_state[key] = value
+    return at
+
+
+def journey_customer(rec: Recorder, rng: random.Random, blob_root: str, photos: int):
+    from media import ingest_image
+    from storage import JobStore
+    at = rec.step("customer", _app())
+    at.text_input(key="cust_email").input(f"bench{rng.randrange(10**6)}@example.com")
+    rec.step("customer", at, lambda at: [b for b in at.button if b.label == "Start New Job"][0].click())
+    job_id = at.query_params["job_id"]
+    store = JobStore()
+    for _ in range(photos):
+        store.add_photo(job_id, {
+            **ingest_image(_image(rng), blob_root),
+            "timestamp": datetime.now().isoformat(),
+            "uploaded_by": "customer",
+        })
+    rec.step("customer", at)
+    rec.step("customer", at, lambda at: at.radio(key=f"section_{job_id}").set_value("💬 Chat"))
+    at.text_input(key=f"chat_input_{job_id}").input(_text(rng, 8))
+    rec.step("customer", at, lambda at: [b for b in at.button if b.label == "Send"][0].click())
+    rec.step("customer", at, lambda at: at.radio(key=f"section_{job_id}").set_value("ℹ️ Details"))
+
+
+def journey_technician(rec: Recorder, rng: random.Random):
+    tech = f"tech{rng.randrange(3, 50)}@example.com"
+    at = rec.step("technician", _app(current_user={"role": "technician", "email": tech}))
+    claim = [b for b in at.button if b.label == "Claim Job"]
+    if not claim:
+        return
+    job_id = claim[0].key[len("claim_"):]
+    rec.step("technician", at, lambda at: claim[0].click())
+    at.query_params["job_id"] = job_id
+    rec.step("technician", at)
+    rec.step("technician", at, lambda at: at.radio(key=f"section_{job_id}").set_value("💰 Quotes"))
+    at.number_input[0].set_value(round(rng.uniform(50, 900), 2))
+    at.text_area[0].input(_text(rng, 6))
+    rec.step("technician", at, lambda at: [b for b in at.button if b.label == "Submit Quote"][0].click())
+
+
+def journey_admin(rec: Recorder, rng: random.Random):
+    at = rec.step("admin", _app(current_user={"role": "admin"}))
+    rec.step("admin", at, lambda at: at.selectbox(key="admin_sort").set_value("Highest quote"))
+    rec.step("admin", at, lambda at: at.multiselect(key="admin_status").select("open"))
+    pages = at.number_input(key="admin_page")
+    if pages.max > 1:
+        rec.step("admin", at, lambda at: at.number_input(key="admin_page").set_value(2))
+    rec.step("admin", at, lambda at: at.text_input(key="admin_search_text").input(rng.choice(WORDS)))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _store_calls(spans: List[Dict]) -> Dict[str, int]:
+    calls = defaultdict(int)
+    for row in spans:
+        if row["span"].startswith("db."):
+            calls[row["span"][3:]] += row["count"]
+    return dict(sorted(calls.items()))
+
+
+def run(args) -> Dict:
+    import profiling
+    from storage import DATA_DIR, JobStore
+
+    rng = random.Random(args.seed)
+    blob_root = os.path.join(DATA_DIR, "blobs")
+    start = time.perf_counter()
+    seed(JobStore(), blob_root, args.jobs, args.photos, args.messages, args.quotes, rng)
+    seconds = time.perf_counter() - start
+    print(f"seeded {args.jobs} jobs in {seconds:.1f}s", file=sys.stderr)
+
+    journeys = {
+        "customer": lambda rec: journey_customer(rec, rng, blob_root, min(args.photos, 3)),
+        "technician": lambda rec: journey_technician(rec, rng),
+        "admin": lambda rec: journey_admin(rec, rng),
+    }
+    # Warm-up pass: cached resources, imports and the first script compile
+    warm = Recorder()
+    for journey in journeys.values():
+        journey(warm)
+
+    profiling.set_enabled(True)
+    results = {}
+    for name, journey in journeys.items():
+        rec = Recorder()
+        profiling.reset()
+        for _ in range(args.repeat):
+            journey(rec)
+        spans, _ = profiling.snapshot()
+        latencies = rec.latencies[name]
+        calls = _store_calls(spans)
+        # Memory in a separate pass: tracemalloc slows everything it watches
+        tracemalloc.start()
+        journey(Recorder())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            "reruns": len(latencies),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2),
+            "peak_memory_mb": round(peak / 2 ** 20, 2),
+            "store_calls_per_rerun": round(sum(calls.values()) / len(latencies), 2),
+            "store_calls": calls,
+        }
+    return {
+        "recorded": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "dataset": {
+            "jobs": args.jobs, "photos": args.photos, "messages": args.messages,
+            "quotes": args.quotes, "repeat": args.repeat, "seed": args.seed,
+        },
+        "journeys": results,
+    }
+
+
+# Metrics checked against the baseline for each journey, with the tolerance that applies
+CHECKS = [
+    ("p50_ms", "latency"),
+    ("p95_ms", "latency"),
+    ("peak_memory_mb", "memory"),
+    ("store_calls_per_rerun", "calls"),
+]
+
+
+def compare(result: Dict, baseline: Dict, tolerance: Dict[str, float]) -> List[str]:
+    """Human-readable regressions of `result` against `baseline`."""
+    regressions = []
+    if result["dataset"] != baseline.get("dataset"):
+        print("warning: baseline was recorded with a different dataset", file=sys.stderr)
+    for name, current in result["journeys"].items():
+        before = baseline.get("journeys", {}).get(name)
+        if not before:
+            continue
+        for metric, kind in CHECKS:
+            old, new = before.get(metric), current[metric]
+            if old is None:
+                continue
+            if new > old * (1 + tolerance[kind]) and new - old > 0.01:
+                regressions.append(f"{name}.{metric}: {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--photos", type=int, default=4, help="photos per job")
+    parser.add_argument("--messages", type=int, default=30, help="chat messages per job")
+    parser.add_argument("--quotes", type=int, default=2, help="quotes per job")
+    parser.add_argument("--repeat", type=int, default=5, help="times each journey is replayed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5,
+                        help="AppTest reruns are noisy; record baselines on the machine that checks them")
+    parser.add_argument("--memory-tolerance", type=float, default=0.15)
+    parser.add_argument("--calls-tolerance", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # The store, blobs and metrics file all live under FIXSYNC_DATA_DIR, which must be
+    # set before anything imports storage
+    os.environ["FIXSYNC_DATA_DIR"] = tempfile.mkdtemp(prefix="fixsync-bench-")
+    os.environ.pop("FIXSYNC_DB", None)
+    os.environ.pop("FIXSYNC_BLOB_DIR", None)
+    sys.path.insert(0, HERE)
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    tolerance = {
+        "latency": args.latency_tolerance,
+        "memory": args.memory_tolerance,
+        "calls": args.calls_tolerance,
+    }
+    regressions = compare(result, baseline, tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+    print("no regressions against baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Read-through LRU cache for hot job data.
+
+Entries are tagged with the job's version. Every write bumps the version in the
+jobs table, so a hit costs one primary-key lookup to confirm the entry is still
+current, and writes made by other server processes invalidate stale entries here
+without any extra messaging. Entries hold typed records (see records.py), roughly half
+the memory of the row dicts, and are turned back into fresh dicts on every read.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from events import ALL_JOBS, EventBus
+from records import Job, Quote
+from storage import JobStore
+
+
+class JobCache:
+    """Caches each job's row and quotes, the parts every job-room rerun reads.
+    Messages and photos have their own cursor/paged queries and are not cached."""
+
+    def __init__(self, store: JobStore, max_entries: int = 512, bus: Optional[EventBus] = None):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, Job, Tuple[Quote, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if bus is not None:
+            # Local writes drop their entry right away instead of on the next read
+            bus.subscribe(ALL_JOBS, lambda event: self.invalidate(event["job_id"]))
+
+    def _load(self, job_id: str) -> Optional[Tuple[int, Job, Tuple[Quote, ...]]]:
+        version = self.store.get_version(job_id)
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if version is None:
+                if entry is not None:
+                    del self._entries[job_id]
+                    self.invalidations += 1
+                self.misses += 1
+                return None
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(job_id)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self.invalidations += 1
+            self.misses += 1
+
+        # Read the rows after the version: if a write lands in between, the entry is
+        # tagged older than its contents and is simply reloaded next time
+        summary = self.store.get_job_summary(job_id)
+        quotes = self.store.get_quotes(job_id)
+        if summary is None:
+            return None
+        entry = (version, Job.from_dict(summary), tuple(Quote.from_dict(q) for q in quotes))
+        with self._lock:
+            self._entries[job_id] = entry
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_job_summary(self, job_id: str) -> Optional[Dict]:
+        """The job row as JobStore.get_job_summary returns it, except that timestamps
+        (`created` here and on get_quotes) come back rounded to whole milliseconds,
+        the precision records keep. Nothing reads them finer than that."""
+        entry = self._load(job_id)
+        # A new dict per call, so callers may edit it (e.g. the details form)
+        return entry[1].to_dict() if entry else None
+
+    def get_quotes(self, job_id: str) -> List[Dict]:
+        entry = self._load(job_id)
+        return [q.to_dict() for q in entry[2]] if entry else []
+
+    def invalidate(self, job_id: str):
+        with self._lock:
+            if self._entries.pop(job_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,127 @@
+"""Job event bus.
+
+Events are rows in an `events` table written in the same transaction as the change
+they describe, so every server process sharing the database sees them in commit
+order by polling with a cursor (the last event id it has seen). Subscribers in the
+same process are also called directly once the write commits.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from storage import JobStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_job ON events(job_id, id);
+"""
+
+# Subscribe to this id to receive events for every job
+ALL_JOBS = "*"
+
+
+def _row_to_event(row: sqlite3.Row) -> Dict:
+    return {
+        "id": row["id"],
+        "job_id": row["job_id"],
+        "kind": row["kind"],
+        "payload": json.loads(row["payload"]),
+        "created": row["created"],
+    }
+
+
+class EventBus:
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._subscribers: Dict[str, List[Callable[[Dict], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        store.conn.executescript(SCHEMA)
+        store.bus = self
+
+    # Called by JobStore inside a write transaction
+    def publish(self, conn: sqlite3.Connection, job_id: str, kind: str, payload: Optional[Dict] = None) -> Dict:
+        created = time.time()
+        payload = payload or {}
+        cur = conn.execute(
+            "INSERT INTO events (job_id, kind, payload, created) VALUES (?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), created),
+        )
+        return {"id": cur.lastrowid, "job_id": job_id, "kind": kind, "payload": payload, "created": created}
+
+    # Called by JobStore after the transaction commits
+    def dispatch(self, event: Dict):
+        with self._lock:
+            callbacks = self._subscribers.get(event["job_id"], []) + self._subscribers.get(ALL_JOBS, [])
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                # A broken subscriber must not fail the write that already committed
+                pass
+
+    def subscribe(self, job_id: str, callback: Callable[[Dict], None]) -> Callable[[], None]:
+        """Call `callback(event)` for each committed event on `job_id` in this process.
+        Returns a function that removes the subscription."""
+        with self._lock:
+            self._subscribers[job_id].append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers.get(job_id, []):
+                    self._subscribers[job_id].remove(callback)
+        return unsubscribe
+
+    def poll(self, job_id: str, after_id: int = 0, limit: int = 500) -> List[Dict]:
+        """Events on `job_id` newer than the cursor, from any process."""
+        if job_id == ALL_JOBS:
+            rows = self.store.conn.execute(
+                "SELECT * FROM events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            )
+        else:
+            rows = self.store.conn.execute(
+                "SELECT * FROM events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (job_id, after_id, limit),
+            )
+        return [_row_to_event(row) for row in rows]
+
+    def head(self, job_id: str = ALL_JOBS) -> int:
+        """The newest event id, to start polling from 'now'."""
+        if job_id == ALL_JOBS:
+            # The id sequence, not MAX(id): it survives pruning of the newest rows too
+            row = self.store.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+            if row is None:
+                return 0
+        else:
+            row = self.store.conn.execute(
+                "SELECT MAX(id) FROM events WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def changed_since(self, after_id: int) -> Optional[Tuple[Set[str], int]]:
+        """(ids of jobs with events after the cursor, new cursor), or None if events after
+        the cursor have already been pruned and the caller must reload everything."""
+        conn = self.store.conn
+        head = self.head()
+        if head <= after_id:
+            return set(), after_id
+        oldest = conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+        if oldest is None or oldest > after_id + 1:
+            return None
+        rows = conn.execute(
+            "SELECT DISTINCT job_id FROM events WHERE id > ? AND id <= ?", (after_id, head)
+        )
+        return {r[0] for r in rows}, head
+
+    def prune(self, max_age_seconds: float = 7 * 24 * 3600) -> int:
+        with self.store._tx() as conn:
+            cur = conn.execute("DELETE FROM events WHERE created < ?", (time.time() - max_age_seconds,))
+            return cur.rowcount
@@ -0,0 +1,436 @@
+"""Content-addressed blob storage for job media."""
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+try:
+    # Optional: HEIC/HEIF decoding for iPhone uploads
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+from storage import DATA_DIR, JobStore
+
+BLOB_DIR = os.environ.get("FIXSYNC_BLOB_DIR", os.path.join(DATA_DIR, "blobs"))
+
+# Fixed-size derivatives generated once at upload: name -> longest edge in pixels
+DERIVATIVE_SIZES = {"thumb": 256, "preview": 1024}
+
+# Stored originals are capped at this longest edge; phone photos beyond it are downscaled
+MAX_ORIGINAL_EDGE = 4096
+INGEST_WORKERS = int(os.environ.get("FIXSYNC_INGEST_WORKERS", os.cpu_count() or 2))
+
+# Videos are copied to disk in chunks of this size and served by a range-capable media server
+CHUNK_SIZE = 1024 * 1024
+MEDIA_HOST = os.environ.get("FIXSYNC_MEDIA_HOST", "127.0.0.1")
+MEDIA_PORT = int(os.environ.get("FIXSYNC_MEDIA_PORT", "8765"))
+# URL the browser uses to reach the media server (e.g. behind a reverse proxy)
+MEDIA_URL = os.environ.get("FIXSYNC_MEDIA_URL", f"http://localhost:{MEDIA_PORT}")
+
+
+class BlobStore:
+    """Stores bytes under their SHA-256 in a sharded tree: ab/cd/abcd....
+
+    Writing the same bytes twice is a no-op, so identical uploads are deduplicated.
+    """
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def put_stream(self, stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+        """Copy a file-like object into the store chunk by chunk, hashing as it goes.
+
+        Returns (digest, size). Memory use is one chunk regardless of the stream length.
+        """
+        tmp_dir = os.path.join(self.root, ".incoming")
+        os.makedirs(tmp_dir, exist_ok=True)
+        sha, size = hashlib.sha256(), 0
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            target = self.path(digest)
+            if os.path.exists(target):
+                os.unlink(tmp)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest, size
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+def migrate_inline_photos(store: JobStore, blobs: BlobStore) -> int:
+    """Move legacy base64 photos out of the database and into the blob store."""
+    moved = 0
+    for photo_id, data in store.inline_photos():
+        raw = base64.b64decode(data)
+        store.set_photo_blob(photo_id, blobs.put(raw), len(raw))
+        moved += 1
+    return moved
+
+
+def make_derivatives(img: Image.Image) -> Dict[str, bytes]:
+    """Encode a JPEG per entry in DERIVATIVE_SIZES, never upscaling the source."""
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    out = {}
+    for name, edge in DERIVATIVE_SIZES.items():
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        buf = io.BytesIO()
+        resized.save(buf, format="JPEG", quality=80, optimize=True)
+        out[name] = buf.getvalue()
+    return out
+
+
+def store_derivatives(img: Image.Image, blobs: BlobStore) -> Dict[str, str]:
+    """Write derivatives to the blob store; returns e.g. {"thumb_sha256": ..., "preview_sha256": ...}."""
+    return {f"{name}_sha256": blobs.put(data) for name, data in make_derivatives(img).items()}
+
+
+def backfill_derivatives(store: JobStore, blobs: BlobStore) -> int:
+    """Generate thumbnails and previews for photos stored before derivatives existed."""
+    done = 0
+    for photo_id, digest in store.photos_missing_derivatives():
+        path = blobs.path(digest)
+        if not os.path.exists(path):
+            continue
+        with Image.open(path) as img:
+            hashes = store_derivatives(img, blobs)
+        store.set_photo_derivatives(photo_id, hashes["thumb_sha256"], hashes["preview_sha256"])
+        done += 1
+    return done
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # Flatten transparency onto white; JPEG has no alpha channel
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def ingest_image(data: bytes, blob_root: str = BLOB_DIR, max_edge: int = MAX_ORIGINAL_EDGE) -> Dict:
+    """Decode, orient, normalise and recompress one upload, writing it and its derivatives
+    to the blob store. Runs in a worker process, so only hashes and metadata come back."""
+    blobs = BlobStore(blob_root)
+    with Image.open(io.BytesIO(data)) as img:
+        # JPEG can decode straight to a reduced scale, so huge bitmaps are never materialised
+        img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        # reduce() only handles 8-bit modes, so palette, 1-bit and 16-bit images convert first
+        img = _to_rgb(img)
+        factor = max(img.width, img.height) // max_edge
+        if factor >= 2:
+            img = img.reduce(factor)
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        buf = io.BytesIO()
+        # No exif= argument: GPS and device metadata are stripped from the stored copy
+        img.save(buf, format="JPEG", quality=85, optimize=True)
+        raw = buf.getvalue()
+        return {
+            "sha256": blobs.put(raw),
+            "content_type": "image/jpeg",
+            "size": len(raw),
+            "width": img.width,
+            "height": img.height,
+            **store_derivatives(img, blobs),
+        }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_ingest_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the Streamlit server is multi-threaded
+        _pool = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _reset_ingest_pool(pool: ProcessPoolExecutor):
+    """Drop the shared pool if it is `pool`, e.g. after a worker died and broke it."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ingest_uploads(
+    files: List[Tuple[str, bytes]],
+    blob_root: str = BLOB_DIR,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """Process (key, bytes) uploads in parallel, yielding (key, photo, error) as each finishes."""
+    shared = pool is None
+    pool = pool or get_ingest_pool()
+    try:
+        futures = {pool.submit(ingest_image, data, blob_root): key for key, data in files}
+    except BrokenProcessPool:
+        # A worker of the shared pool died (OOM-killed, say) during an earlier batch
+        if not shared:
+            raise
+        _reset_ingest_pool(pool)
+        pool = get_ingest_pool()
+        futures = {pool.submit(ingest_image, data, blob_root): key for key, data in files}
+    broken = False
+    for future in as_completed(futures):
+        key = futures[future]
+        try:
+            yield key, future.result(), None
+        except BrokenProcessPool as e:
+            broken = True
+            yield key, None, f"{type(e).__name__}: {e}"
+        except Exception as e:
+            yield key, None, f"{type(e).__name__}: {e}"
+    if broken and shared:
+        _reset_ingest_pool(pool)
+
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload offset, payload end) for each ISO-BMFF box between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _probe_mp4(path: str) -> Dict:
+    """Duration and frame size from the moov/mvhd and tkhd boxes of an MP4 or MOV file.
+    Only the box headers are read, never the media data."""
+    info: Dict = {}
+    with open(path, "rb") as f:
+        end = os.path.getsize(path)
+        for kind, start, stop in _mp4_boxes(f, 0, end):
+            if kind != b"moov":
+                continue
+            for sub, s_start, s_stop in _mp4_boxes(f, start, stop):
+                if sub == b"mvhd":
+                    f.seek(s_start)
+                    version = f.read(1)[0]
+                    f.read(3)
+                    if version == 1:
+                        _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                    else:
+                        _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                    if timescale:
+                        info["duration"] = duration / timescale
+                elif sub == b"trak" and "width" not in info:
+                    for t_kind, t_start, t_stop in _mp4_boxes(f, s_start, s_stop):
+                        if t_kind == b"tkhd" and t_stop - t_start >= 84:
+                            # Width and height are 16.16 fixed point, the last 8 bytes of tkhd
+                            f.seek(t_stop - 8)
+                            width, height = struct.unpack(">II", f.read(8))
+                            if width and height:
+                                info["width"], info["height"] = width >> 16, height >> 16
+            break
+    return info
+
+
+def probe_video(path: str) -> Dict:
+    """Duration, frame size and a JPEG poster frame for a stored video.
+
+    Uses ffprobe/ffmpeg when installed; otherwise, or if they fail or time out, reads
+    duration and size from the MP4 container and returns no poster.
+    """
+    info: Dict = {}
+    try:
+        info.update(_probe_mp4(path))
+    except (OSError, struct.error, IndexError):
+        pass
+    try:
+        if shutil.which("ffprobe"):
+            out = subprocess.run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "format=duration:stream=width,height", "-of", "default=nw=1", path],
+                capture_output=True, text=True, timeout=30,
+            ).stdout
+            for key, value in re.findall(r"^(duration|width|height)=([\d.]+)$", out, re.M):
+                info[key] = float(value) if key == "duration" else int(value)
+        if shutil.which("ffmpeg"):
+            # Grab a frame one second in (or the first frame for very short clips)
+            seek = "1" if info.get("duration", 0) > 1 else "0"
+            poster = subprocess.run(
+                ["ffmpeg", "-v", "error", "-ss", seek, "-i", path, "-frames:v", "1",
+                 "-vf", "scale='min(1024,iw)':-2", "-f", "image2", "-c:v", "mjpeg", "pipe:1"],
+                capture_output=True, timeout=60,
+            ).stdout
+            if poster:
+                info["poster"] = poster
+    except (subprocess.TimeoutExpired, OSError):
+        # A hung or broken ffmpeg must not fail the upload: the blob is already stored,
+        # so keep what the container header gave and go without a poster
+        info.pop("poster", None)
+    return info
+
+
+def ingest_video(stream: BinaryIO, content_type: str, blobs: BlobStore) -> Dict:
+    """Stream an uploaded video into the blob store and extract its metadata once."""
+    digest, size = blobs.put_stream(stream)
+    info = probe_video(blobs.path(digest))
+    poster = info.pop("poster", None)
+    return {
+        "sha256": digest,
+        "content_type": content_type,
+        "size": size,
+        "poster_sha256": blobs.put(poster) if poster else None,
+        **info,
+    }
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    """Serves /<sha256> from the blob store with HTTP Range support, so browsers can
+    seek in large videos without the server ever reading a whole file."""
+
+    blobs: BlobStore
+    content_types: Callable[[str], Optional[str]]
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool):
+        digest = self.path.lstrip("/").split("?")[0]
+        if not re.fullmatch(r"[0-9a-f]{64}", digest) or not self.blobs.exists(digest):
+            self.send_error(404)
+            return
+        path = self.blobs.path(digest)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", self.content_types(digest) or "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if not send_body:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_media_server(
+    blobs: BlobStore,
+    content_types: Callable[[str], Optional[str]] = lambda digest: None,
+    host: str = MEDIA_HOST,
+    port: int = MEDIA_PORT,
+) -> Optional[ThreadingHTTPServer]:
+    """Serve the blob store over HTTP on a daemon thread. Returns None if the port is
+    already taken, e.g. by another server process on the same machine doing the same."""
+    handler = type("MediaHandler", (_MediaHandler,), {
+        "blobs": blobs, "content_types": staticmethod(content_types)
+    })
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fixsync-media", daemon=True).start()
+    return server
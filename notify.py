@@ -0,0 +1,429 @@
+"""Outbox-based notifications for job events.
+
+A background worker turns the event log (events.py) into notifications in two
+stages, neither of which runs on a Streamlit rerun:
+
+1. collect(): reads events after its cursor and writes one `outbox` row per recipient
+   and channel ("Job #AB12CD34: new quote for $350.00"). The cursor moves in the
+   same transaction, so every event is fanned out exactly once, even with one worker
+   per server process.
+2. deliver(): once the oldest pending row for a recipient and channel is
+   COALESCE_SECONDS old, sends all of that recipient's pending rows as a single digest
+   ("Job #AB12CD34: 10 new messages"). Rows are leased while being sent. Failures are
+   retried with exponential backoff until MAX_ATTEMPTS, then marked failed.
+
+Channels are pluggable: anything with a `name` and a `send()` that raises on failure.
+Email goes to SMTP when FIXSYNC_SMTP_HOST is set, otherwise to .eml files in
+MAIL_DIR; webhooks are posted to FIXSYNC_WEBHOOK_URL if set.
+`python notify.py sink` runs a local webhook receiver for testing.
+"""
+import argparse
+import json
+import os
+import random
+import smtplib
+import threading
+import time
+import urllib.request
+import uuid
+from collections import Counter
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from events import ALL_JOBS
+from storage import DATA_DIR, JobStore
+
+APP_URL = os.environ.get("FIXSYNC_APP_URL", "http://localhost:8501")
+MAIL_DIR = os.environ.get("FIXSYNC_MAIL_DIR", os.path.join(DATA_DIR, "mail"))
+SMTP_HOST = os.environ.get("FIXSYNC_SMTP_HOST")
+SMTP_PORT = int(os.environ.get("FIXSYNC_SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("FIXSYNC_SMTP_USER")
+SMTP_PASSWORD = os.environ.get("FIXSYNC_SMTP_PASSWORD")
+MAIL_FROM = os.environ.get("FIXSYNC_MAIL_FROM", "FixSync <notifications@fixsync.local>")
+WEBHOOK_URL = os.environ.get("FIXSYNC_WEBHOOK_URL")
+
+# A recipient's notifications are held this long so a burst arrives as one digest
+COALESCE_SECONDS = float(os.environ.get("FIXSYNC_NOTIFY_COALESCE", "60"))
+POLL_SECONDS = 5.0
+EVENT_BATCH = 500
+MAX_GROUPS = 50
+LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 30.0
+BACKOFF_MAX = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    -- pending, sent or failed
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    -- A worker sending this row holds it until then
+    lease REAL NOT NULL DEFAULT 0,
+    sent REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(recipient, channel, created) WHERE state = 'pending';
+CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox(state, id);
+
+-- The last event fanned out into the outbox
+CREATE TABLE IF NOT EXISTS outbox_cursor (
+    name TEXT PRIMARY KEY,
+    event_id INTEGER NOT NULL
+);
+"""
+
+# How each kind reads in a digest when it happened more than once on a job
+_PLURALS = {
+    "message": "new messages",
+    "photo": "new photos",
+    "quote": "new quotes",
+    "quote_decision": "quote decisions",
+    "status": "status changes",
+}
+
+
+class Channel:
+    """A delivery channel. `send` raises on failure; the outbox retries it later."""
+
+    name = "channel"
+
+    def send(self, recipient: str, subject: str, body: str, items: List[Dict]):
+        raise NotImplementedError
+
+
+class SMTPChannel(Channel):
+    name = "email"
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = MAIL_FROM,
+                 user: Optional[str] = SMTP_USER, password: Optional[str] = SMTP_PASSWORD):
+        self.host, self.port, self.sender = host, port, sender
+        self.user, self.password = user, password
+
+    def send(self, recipient: str, subject: str, body: str, items: List[Dict]):
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            if self.user:
+                smtp.starttls()
+                smtp.login(self.user, self.password)
+            smtp.send_message(_email(self.sender, recipient, subject, body))
+
+
+class MailDirChannel(Channel):
+    """Stand-in for SMTP: writes each email as an .eml file."""
+
+    name = "email"
+
+    def __init__(self, root: str = MAIL_DIR, sender: str = MAIL_FROM):
+        self.root = root
+        self.sender = sender
+        os.makedirs(root, exist_ok=True)
+
+    def send(self, recipient: str, subject: str, body: str, items: List[Dict]):
+        path = os.path.join(self.root, f"{time.time():.6f}-{uuid.uuid4().hex[:8]}.eml")
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(bytes(_email(self.sender, recipient, subject, body)))
+        os.replace(f"{path}.tmp", path)
+
+
+class WebhookChannel(Channel):
+    """POSTs each digest as JSON; any non-2xx response is a failure."""
+
+    name = "webhook"
+
+    def __init__(self, url: str = WEBHOOK_URL, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, recipient: str, subject: str, body: str, items: List[Dict]):
+        data = json.dumps({"recipient": recipient, "subject": subject, "text": body, "items": items}).encode()
+        request = urllib.request.Request(
+            self.url, data=data, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def default_channels() -> List[Channel]:
+    channels: List[Channel] = [SMTPChannel() if SMTP_HOST else MailDirChannel()]
+    if WEBHOOK_URL:
+        channels.append(WebhookChannel())
+    return channels
+
+
+def _email(sender: str, recipient: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+def backoff(attempts: int) -> float:
+    """Seconds to wait before retry number `attempts`: doubling, capped, with jitter."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+
+def compose(rows: List[Dict]) -> Tuple[str, str]:
+    """(subject, body) of the digest for one recipient's pending rows, oldest first."""
+    counts = Counter((row["job_id"], row["kind"]) for row in rows)
+    lines, seen = [], set()
+    for row in rows:
+        key = (row["job_id"], row["kind"])
+        if counts[key] > 1:
+            if key in seen:
+                continue
+            seen.add(key)
+            lines.append(f"Job #{row['job_id']}: {counts[key]} {_PLURALS.get(row['kind'], 'updates')}")
+        else:
+            lines.append(row["text"])
+    jobs = sorted({row["job_id"] for row in rows})
+    subject = lines[0] if len(lines) == 1 else f"{len(rows)} updates on {len(jobs)} job(s)"
+    links = [f"Job #{job_id}: {APP_URL}/?job_id={job_id}" for job_id in jobs]
+    return f"FixSync: {subject}", "\n".join(lines) + "\n\n" + "\n".join(links) + "\n"
+
+
+class Notifier:
+    def __init__(self, store: JobStore, channels: Optional[List[Channel]] = None,
+                 coalesce_seconds: float = COALESCE_SECONDS):
+        self.store = store
+        self.channels = {c.name: c for c in (channels if channels is not None else default_channels())}
+        self.coalesce_seconds = coalesce_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        store.conn.executescript(SCHEMA)
+        if store.bus is not None:
+            # Local writes wake the worker at once; other processes' writes are picked up by polling
+            store.bus.subscribe(ALL_JOBS, lambda event: self._wake.set())
+
+    # Stage 1: events -> outbox
+    def _recipients(self, conn, event: Dict) -> List[Tuple[str, str, str]]:
+        """[(recipient, kind, text)] for one event."""
+        job = conn.execute(
+            "SELECT customer_email, assigned_tech FROM jobs WHERE id = ?", (event["job_id"],)
+        ).fetchone()
+        if job is None:
+            return []
+        customer, tech = job["customer_email"], job["assigned_tech"]
+        job_ref = f"Job #{event['job_id']}"
+        payload = event["payload"]
+        kind = event["kind"]
+        out = []
+        if kind == "message":
+            msg = conn.execute(
+                "SELECT type, role, text, sender FROM messages WHERE id = ?", (payload.get("message_id"),)
+            ).fetchone()
+            # System lines duplicate the quote/status events they announce
+            if msg is None or msg["type"] == "system":
+                return []
+            preview = msg["text"] if len(msg["text"]) <= 80 else msg["text"][:77] + "..."
+            if msg["role"] == "customer":
+                out.append((tech, "message", f"{job_ref}: customer wrote \"{preview}\""))
+            else:
+                out.append((customer, "message", f"{job_ref}: {msg['sender'] or 'your technician'} wrote \"{preview}\""))
+        elif kind == "photo":
+            out.append((tech, "photo", f"{job_ref}: a new photo was added"))
+        elif kind == "quote":
+            quote = conn.execute(
+                "SELECT amount, technician FROM quotes WHERE job_id = ? AND id = ?",
+                (event["job_id"], payload.get("quote_id")),
+            ).fetchone()
+            if quote is None:
+                return []
+            status = payload.get("status")
+            if status == "pending":
+                out.append((customer, "quote", f"{job_ref}: new quote for ${quote['amount']:,.2f}"))
+            elif status in ("approved", "declined"):
+                out.append((quote["technician"] or tech, "quote_decision",
+                            f"{job_ref}: your ${quote['amount']:,.2f} quote was {status}"))
+        elif kind == "claimed":
+            out.append((customer, "claimed", f"{job_ref}: {payload.get('technician')} is now handling your job"))
+        elif kind == "job" and "status" in payload.get("fields", []):
+            status = conn.execute("SELECT status FROM jobs WHERE id = ?", (event["job_id"],)).fetchone()[0]
+            text = f"{job_ref}: status is now {status.replace('_', ' ')}"
+            out += [(customer, "status", text), (tech, "status", text)]
+        # Nobody is told about their own change; a role stands for that party on this job
+        actor = payload.get("actor")
+        own = {actor, {"customer": customer, "technician": tech}.get(actor)}
+        return [(recipient, k, text) for recipient, k, text in out if recipient and recipient not in own]
+
+    def collect(self) -> int:
+        """Fan new events out into the outbox. Returns the number of rows written."""
+        written = 0
+        while True:
+            with self.store._tx() as conn:
+                row = conn.execute("SELECT event_id FROM outbox_cursor WHERE name = 'events'").fetchone()
+                if row is None:
+                    # Start from now: history is not notified
+                    conn.execute(
+                        "INSERT INTO outbox_cursor (name, event_id) VALUES ('events', ?)", (self.store.bus.head(),)
+                    )
+                    return written
+                events = self.store.bus.poll(ALL_JOBS, row["event_id"], EVENT_BATCH)
+                if not events:
+                    return written
+                now = time.time()
+                rows = [
+                    (recipient, channel, event["job_id"], kind, text, now, now)
+                    for event in events
+                    for recipient, kind, text in self._recipients(conn, event)
+                    for channel in self.channels
+                ]
+                conn.executemany(
+                    "INSERT INTO outbox (recipient, channel, job_id, kind, text, created, next_attempt) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("UPDATE outbox_cursor SET event_id = ? WHERE name = 'events'", (events[-1]["id"],))
+                written += len(rows)
+
+    # Stage 2: outbox -> channels
+    def _claim(self, now: float) -> List[Tuple[str, str, List[Dict]]]:
+        """Lease the due digests: [(recipient, channel, rows)]."""
+        with self.store._tx() as conn:
+            groups = conn.execute(
+                "SELECT recipient, channel FROM outbox WHERE state = 'pending' AND lease < :now "
+                "GROUP BY recipient, channel "
+                "HAVING MIN(created) <= :ready AND MAX(next_attempt) <= :now LIMIT :limit",
+                {"now": now, "ready": now - self.coalesce_seconds, "limit": MAX_GROUPS},
+            ).fetchall()
+            claimed = []
+            for group in groups:
+                rows = [dict(r) for r in conn.execute(
+                    "SELECT id, job_id, kind, text, attempts FROM outbox "
+                    "WHERE state = 'pending' AND lease < ? AND recipient = ? AND channel = ? ORDER BY id",
+                    (now, group["recipient"], group["channel"]),
+                )]
+                conn.executemany(
+                    "UPDATE outbox SET lease = ? WHERE id = ?", [(now + LEASE_SECONDS, r["id"]) for r in rows]
+                )
+                claimed.append((group["recipient"], group["channel"], rows))
+        return claimed
+
+    def deliver(self, now: Optional[float] = None) -> int:
+        """Send every due digest. Returns the number of outbox rows delivered."""
+        now = time.time() if now is None else now
+        delivered = 0
+        for recipient, channel_name, rows in self._claim(now):
+            channel = self.channels.get(channel_name)
+            subject, body = compose(rows)
+            items = [{"job_id": r["job_id"], "kind": r["kind"], "text": r["text"]} for r in rows]
+            try:
+                if channel is None:
+                    raise RuntimeError(f"channel {channel_name!r} is not configured")
+                channel.send(recipient, subject, body, items)
+            except Exception as e:
+                with self.store._tx() as conn:
+                    for r in rows:
+                        attempts = r["attempts"] + 1
+                        conn.execute(
+                            "UPDATE outbox SET attempts = ?, next_attempt = ?, lease = 0, error = ?, state = ? WHERE id = ?",
+                            (attempts, now + backoff(attempts), f"{type(e).__name__}: {e}"[:500],
+                             "failed" if attempts >= MAX_ATTEMPTS else "pending", r["id"]),
+                        )
+                continue
+            with self.store._tx() as conn:
+                conn.executemany(
+                    "UPDATE outbox SET state = 'sent', sent = ?, lease = 0, error = NULL WHERE id = ?",
+                    [(time.time(), r["id"]) for r in rows],
+                )
+            delivered += len(rows)
+        return delivered
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        self.collect()
+        return self.deliver(now)
+
+    # Background worker
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # A bad pass (e.g. the database briefly locked) must not kill the worker
+                pass
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def start(self, interval: float = POLL_SECONDS) -> "Notifier":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="notifier", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # Admin
+    def stats(self) -> Dict[str, int]:
+        counts = dict(self.store.conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in ("pending", "sent", "failed")}
+
+    def failures(self, limit: int = 20) -> List[Dict]:
+        rows = self.store.conn.execute(
+            "SELECT id, recipient, channel, text, attempts, error, state FROM outbox "
+            "WHERE error IS NOT NULL AND state != 'sent' ORDER BY id DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    def retry_failed(self) -> int:
+        with self.store._tx() as conn:
+            cur = conn.execute(
+                "UPDATE outbox SET state = 'pending', attempts = 0, next_attempt = ?, lease = 0 WHERE state = 'failed'",
+                (time.time(),),
+            )
+        self._wake.set()
+        return cur.rowcount
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        print(json.dumps(json.loads(body or b"{}"), indent=2), flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    sink = commands.add_parser("sink", help="print webhook deliveries (set FIXSYNC_WEBHOOK_URL to it)")
+    sink.add_argument("--port", type=int, default=8766)
+    commands.add_parser("run", help="run the delivery worker in the foreground")
+    args = parser.parse_args()
+
+    if args.command == "sink":
+        print(f"Listening on http://127.0.0.1:{args.port}/", flush=True)
+        ThreadingHTTPServer(("127.0.0.1", args.port), _SinkHandler).serve_forever()
+        return
+
+    from events import EventBus
+    store = JobStore()
+    EventBus(store)
+    notifier = Notifier(store)
+    while True:
+        sent = notifier.run_once()
+        if sent:
+            print(f"Delivered {sent} notification(s)", flush=True)
+        time.sleep(POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
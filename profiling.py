@@ -0,0 +1,228 @@
+"""Per-rerun timing spans, counters and latency histograms.
+
+Spans are recorded under the page being rendered (set by `page()` around a full
+rerun; fragment-only reruns are recorded under "fragment") and aggregated into
+fixed-bucket histograms for this server process. The admin dashboard reads
+`snapshot()`, and `export()` writes the Prometheus text format for a node_exporter
+textfile collector.
+
+Profiling is on unless FIXSYNC_PROFILE=0. When off, `span()` returns a shared no-op
+context manager and `timed` functions make one flag check before calling through.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+from storage import DATA_DIR
+
+METRICS_FILE = os.environ.get("FIXSYNC_METRICS_FILE", os.path.join(DATA_DIR, "metrics.prom"))
+EXPORT_INTERVAL = 15.0
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("FIXSYNC_PROFILE", "1") != "0"
+_NOOP = nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+_last_export = 0.0
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (capped at the observed max)."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+_spans: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+_counters: Dict[Tuple[str, str], float] = defaultdict(float)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(on: bool):
+    global _enabled
+    _enabled = on
+
+
+def current_page() -> str:
+    return getattr(_local, "page", None) or "fragment"
+
+
+def _record(name: str, seconds: float):
+    key = (current_page(), name)
+    with _lock:
+        _spans[key].observe(seconds)
+
+
+@contextmanager
+def _span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def span(name: str):
+    """Time a block: `with profiling.span("auth"): ...`"""
+    return _span(name) if _enabled else _NOOP
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of span()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def instrument(cls, prefix: str):
+    """Time every static method of `cls` as `<prefix>.<method>` (used for the DB facade)."""
+    for attr, value in list(vars(cls).items()):
+        if isinstance(value, staticmethod):
+            setattr(cls, attr, staticmethod(timed(f"{prefix}.{attr}")(value.__func__)))
+    return cls
+
+
+def count(name: str, value: float = 1):
+    if _enabled:
+        key = (current_page(), name)
+        with _lock:
+            _counters[key] += value
+
+
+@contextmanager
+def page(name: str):
+    """Mark a full rerun of `name`; its spans and counters are grouped under it and the
+    whole rerun is timed as the "rerun" span."""
+    if not _enabled:
+        yield
+        return
+    _local.page = name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record("rerun", time.perf_counter() - start)
+        _local.page = None
+        maybe_export()
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def snapshot() -> Tuple[List[Dict], List[Dict]]:
+    """(span rows, counter rows) for display, slowest total time first."""
+    with _lock:
+        spans = [
+            {
+                "page": key[0],
+                "span": key[1],
+                "count": h.count,
+                "total_ms": h.total * 1000,
+                "mean_ms": h.total / h.count * 1000,
+                "p50_ms": h.quantile(0.5) * 1000,
+                "p95_ms": h.quantile(0.95) * 1000,
+                "max_ms": h.max * 1000,
+            }
+            for key, h in _spans.items() if h.count
+        ]
+        counters = [{"page": key[0], "counter": key[1], "value": v} for key, v in _counters.items()]
+    spans.sort(key=lambda row: row["total_ms"], reverse=True)
+    counters.sort(key=lambda row: (row["counter"], row["page"]))
+    return spans, counters
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text() -> str:
+    """Everything recorded so far in the Prometheus text exposition format."""
+    with _lock:
+        spans = [(key, list(h.buckets), h.count, h.total) for key, h in sorted(_spans.items())]
+        counters = sorted(_counters.items())
+    lines = [
+        "# HELP fixsync_span_seconds Time spent in render sections and data calls.",
+        "# TYPE fixsync_span_seconds histogram",
+    ]
+    for (page_name, name), buckets, n, total in spans:
+        cumulative = 0
+        for bound, hits in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += hits
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"fixsync_span_seconds_bucket{_labels(page=page_name, span=name, le=le)} {cumulative}")
+        lines.append(f"fixsync_span_seconds_sum{_labels(page=page_name, span=name)} {total}")
+        lines.append(f"fixsync_span_seconds_count{_labels(page=page_name, span=name)} {n}")
+    names = sorted({name for (_, name), _ in counters})
+    for name in names:
+        lines.append(f"# TYPE fixsync_{name}_total counter")
+        for (page_name, counter), value in counters:
+            if counter == name:
+                lines.append(f"fixsync_{name}_total{_labels(page=page_name)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path: Optional[str] = None):
+    """Write prometheus_text() atomically, for a textfile collector to scrape."""
+    path = path or METRICS_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def maybe_export():
+    global _last_export
+    now = time.monotonic()
+    if now - _last_export < EXPORT_INTERVAL:
+        return
+    _last_export = now
+    try:
+        export()
+    except OSError:
+        # Metrics export must never break a page
+        pass
@@ -0,0 +1,383 @@
+"""Typed, compact job records.
+
+The store and UI pass jobs around as dicts of ISO-8601 strings. These `__slots__`
+records hold the same data with epoch-millisecond timestamps and enum-coded
+status/priority/category, and pack to a struct-based binary form, for code that
+keeps many jobs in memory (the job cache) or moves them in bulk.
+
+`from_dict` is the migration path from the dict shape (`migrate_job` converts a whole
+job) and `to_dict` goes back to it, so either form can be used at any boundary.
+Timestamps keep millisecond precision. A value that does not fit the compact form
+(a label outside the enum or an unparseable timestamp, e.g. from an import) is kept
+as given rather than rejected, so a record can always be read back and packed.
+"""
+import math
+import struct
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple, Union
+
+# Written into every packed record. Bump it when a layout changes and teach
+# Record.unpack to read the previous one.
+SCHEMA_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Packed sentinels: missing values, and values kept as given (their text is packed
+# after the string fields)
+_NULL_INT = -(2 ** 63)
+_RAW_INT = _NULL_INT + 1
+_NULL_ENUM = 255
+_RAW_ENUM = 254
+_NULL_STR = 0xFFFFFFFF
+_LENGTH = struct.Struct("<I")
+
+# Field kinds: "s" str, "i" int, "f" float, "t" timestamp (ms), or an enum class
+_FORMATS = {"i": "q", "t": "q", "f": "d"}
+
+
+def to_ms(value: Optional[str]) -> Union[int, str, None]:
+    """ISO-8601 string to epoch milliseconds. Naive (local wall-clock) times are encoded
+    as-is, without a timezone conversion, so they round-trip exactly."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if dt.tzinfo is not None:
+        dt = (dt - dt.utcoffset()).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(milliseconds=1)
+
+
+def to_iso(ms: Union[int, str, None]) -> Optional[str]:
+    if ms is None or isinstance(ms, str):
+        return ms
+    return (_EPOCH + timedelta(milliseconds=ms)).isoformat()
+
+
+class _Coded(IntEnum):
+    """An enum stored as one byte and shown by its label ("in_progress", "HVAC")."""
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+class Status(_Coded):
+    OPEN = 0
+    IN_PROGRESS = 1
+    QUOTED = 2
+    APPROVED = 3
+    COMPLETED = 4
+    CANCELLED = 5
+
+
+class Priority(_Coded):
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+    EMERGENCY = 3
+
+
+class Category(_Coded):
+    PLUMBING = 0
+    ELECTRICAL = 1
+    HVAC = 2
+    APPLIANCE = 3
+    STRUCTURAL = 4
+    OTHER = 5
+
+    @property
+    def label(self) -> str:
+        return "HVAC" if self is Category.HVAC else self.name.title()
+
+
+class QuoteStatus(_Coded):
+    PENDING = 0
+    APPROVED = 1
+    DECLINED = 2
+
+
+def _codes(enum) -> Dict[str, _Coded]:
+    return {member.label: member for member in enum}
+
+
+_STATUS, _PRIORITY, _CATEGORY, _QUOTE_STATUS = (
+    _codes(Status), _codes(Priority), _codes(Category), _codes(QuoteStatus)
+)
+
+
+def _label(value: Union[_Coded, str, None]) -> Optional[str]:
+    return value.label if isinstance(value, _Coded) else value
+
+
+def _sparse(out: Dict) -> Dict:
+    # Child rows drop their NULL columns, as the store returns them
+    return {k: v for k, v in out.items() if v is not None}
+
+
+class Record:
+    """Base for the typed records. Subclasses list FIELDS as (name, kind) pairs, in
+    packing order, and write their own from_dict/to_dict."""
+
+    __slots__ = ()
+    FIELDS: Tuple[Tuple[str, object], ...] = ()
+    TYPE_CODE = 0
+
+    _classes: Dict[int, type] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Layout: version, type code, fixed-size fields, then a length per string field
+        cls._fixed = tuple((name, kind) for name, kind in cls.FIELDS if kind != "s")
+        cls._strings = tuple(name for name, kind in cls.FIELDS if kind == "s")
+        cls._struct = struct.Struct(
+            "<BB" + "".join(_FORMATS.get(kind, "B") for _, kind in cls._fixed) + "I" * len(cls._strings)
+        )
+        Record._classes[cls.TYPE_CODE] = cls
+
+    def __init__(self, **values):
+        for name, _ in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, name) == getattr(other, name) for name, _ in self.FIELDS
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name, _ in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Record":
+        """Build a record from the dict shape used by the store and UI."""
+        raise NotImplementedError
+
+    def to_dict(self) -> Dict:
+        raise NotImplementedError
+
+    def pack(self) -> bytes:
+        values = [SCHEMA_VERSION, self.TYPE_CODE]
+        raw = []
+        for name, kind in self._fixed:
+            value = getattr(self, name)
+            if value is None:
+                value = math.nan if kind == "f" else _NULL_INT if kind in ("i", "t") else _NULL_ENUM
+            elif isinstance(value, str) and (kind == "t" or isinstance(kind, type)):
+                raw.append(value.encode())
+                value = _RAW_INT if kind == "t" else _RAW_ENUM
+            values.append(value)
+        strings = [getattr(self, name) for name in self._strings]
+        strings = [None if s is None else s.encode() for s in strings]
+        values += [_NULL_STR if s is None else len(s) for s in strings]
+        parts = [self._struct.pack(*values)]
+        parts += [s for s in strings if s]
+        for text in raw:
+            parts += [_LENGTH.pack(len(text)), text]
+        return b"".join(parts)
+
+    @staticmethod
+    def unpack(data: bytes) -> "Record":
+        if data[0] != SCHEMA_VERSION:
+            raise ValueError(f"unsupported record schema version {data[0]}")
+        cls = Record._classes.get(data[1])
+        if cls is None:
+            raise ValueError(f"unknown record type {data[1]}")
+        values = cls._struct.unpack_from(data)
+        fixed = values[2:2 + len(cls._fixed)]
+        lengths = values[2 + len(cls._fixed):]
+        record = object.__new__(cls)
+        offset = cls._struct.size
+        for name, length in zip(cls._strings, lengths):
+            if length == _NULL_STR:
+                setattr(record, name, None)
+            else:
+                setattr(record, name, data[offset:offset + length].decode())
+                offset += length
+        for (name, kind), value in zip(cls._fixed, fixed):
+            if kind == "f":
+                value = None if math.isnan(value) else value
+            elif value in (_RAW_INT, _RAW_ENUM) and (kind == "t") == (value == _RAW_INT):
+                (length,) = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+                value = data[offset:offset + length].decode()
+                offset += length
+            elif value in (_NULL_INT, _NULL_ENUM) and (kind in ("i", "t")) == (value == _NULL_INT):
+                value = None
+            elif isinstance(kind, type):
+                value = kind(value)
+            setattr(record, name, value)
+        return record
+
+
+class Job(Record):
+    __slots__ = (
+        "id", "customer_email", "created", "status", "assigned_tech",
+        "priority", "category", "location", "description",
+    )
+    FIELDS = (
+        ("id", "s"), ("customer_email", "s"), ("created", "t"), ("status", Status),
+        ("assigned_tech", "s"), ("priority", Priority), ("category", Category),
+        ("location", "s"), ("description", "s"),
+    )
+    TYPE_CODE = 1
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Job":
+        r = object.__new__(cls)
+        r.id = d.get("id")
+        r.customer_email = d.get("customer_email")
+        r.created = to_ms(d.get("created"))
+        r.status = _STATUS.get(d.get("status"), d.get("status"))
+        r.assigned_tech = d.get("assigned_tech")
+        r.priority = _PRIORITY.get(d.get("priority"), d.get("priority"))
+        r.category = _CATEGORY.get(d.get("category"), d.get("category"))
+        r.location = d.get("location")
+        r.description = d.get("description")
+        return r
+
+    def to_dict(self) -> Dict:
+        # The job row keeps its NULL columns
+        return {
+            "id": self.id,
+            "customer_email": self.customer_email,
+            "created": to_iso(self.created),
+            "status": _label(self.status),
+            "assigned_tech": self.assigned_tech,
+            "priority": _label(self.priority),
+            "category": _label(self.category),
+            "location": self.location,
+            "description": self.description,
+        }
+
+
+class Message(Record):
+    """A chat or system message. The dict shape's display-only `time` string is not
+    stored; to_dict derives it from `timestamp`."""
+
+    __slots__ = ("id", "type", "role", "text", "sender", "timestamp")
+    FIELDS = (
+        ("id", "i"), ("type", "s"), ("role", "s"), ("text", "s"),
+        ("sender", "s"), ("timestamp", "t"),
+    )
+    TYPE_CODE = 2
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Message":
+        r = object.__new__(cls)
+        r.id = d.get("id")
+        r.type = d.get("type")
+        r.role = d.get("role")
+        r.text = d.get("text")
+        r.sender = d.get("sender")
+        r.timestamp = to_ms(d.get("timestamp"))
+        return r
+
+    def to_dict(self) -> Dict:
+        out = _sparse({
+            "id": self.id,
+            "type": self.type,
+            "role": self.role,
+            "text": self.text,
+            "sender": self.sender,
+            "timestamp": to_iso(self.timestamp),
+        })
+        if isinstance(self.timestamp, int):
+            out["time"] = (_EPOCH + timedelta(milliseconds=self.timestamp)).strftime("%I:%M %p")
+        return out
+
+
+class Quote(Record):
+    __slots__ = (
+        "id", "amount", "breakdown", "timeline", "warranty",
+        "technician", "created", "status",
+    )
+    FIELDS = (
+        ("id", "s"), ("amount", "f"), ("breakdown", "s"), ("timeline", "s"),
+        ("warranty", "s"), ("technician", "s"), ("created", "t"), ("status", QuoteStatus),
+    )
+    TYPE_CODE = 3
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Quote":
+        r = object.__new__(cls)
+        r.id = d.get("id")
+        r.amount = d.get("amount")
+        r.breakdown = d.get("breakdown")
+        r.timeline = d.get("timeline")
+        r.warranty = d.get("warranty")
+        r.technician = d.get("technician")
+        r.created = to_ms(d.get("created"))
+        r.status = _QUOTE_STATUS.get(d.get("status"), d.get("status"))
+        return r
+
+    def to_dict(self) -> Dict:
+        return _sparse({
+            "id": self.id,
+            "amount": self.amount,
+            "breakdown": self.breakdown,
+            "timeline": self.timeline,
+            "warranty": self.warranty,
+            "technician": self.technician,
+            "created": to_iso(self.created),
+            "status": _label(self.status),
+        })
+
+
+class Photo(Record):
+    """Photo metadata; the image itself lives in the blob store under `sha256` (or, for
+    photos not yet migrated there, inline in `data`)."""
+
+    __slots__ = (
+        "id", "sha256", "content_type", "size", "width", "height",
+        "thumb_sha256", "preview_sha256", "timestamp", "uploaded_by", "data",
+    )
+    FIELDS = (
+        ("id", "i"), ("sha256", "s"), ("content_type", "s"), ("size", "i"),
+        ("width", "i"), ("height", "i"), ("thumb_sha256", "s"),
+        ("preview_sha256", "s"), ("timestamp", "t"), ("uploaded_by", "s"), ("data", "s"),
+    )
+    TYPE_CODE = 4
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Photo":
+        r = object.__new__(cls)
+        r.id = d.get("id")
+        r.sha256 = d.get("sha256")
+        r.content_type = d.get("content_type")
+        r.size = d.get("size")
+        r.width = d.get("width")
+        r.height = d.get("height")
+        r.thumb_sha256 = d.get("thumb_sha256")
+        r.preview_sha256 = d.get("preview_sha256")
+        r.timestamp = to_ms(d.get("timestamp"))
+        r.uploaded_by = d.get("uploaded_by")
+        r.data = d.get("data")
+        return r
+
+    def to_dict(self) -> Dict:
+        return _sparse({
+            "id": self.id,
+            "sha256": self.sha256,
+            "content_type": self.content_type,
+            "size": self.size,
+            "width": self.width,
+            "height": self.height,
+            "thumb_sha256": self.thumb_sha256,
+            "preview_sha256": self.preview_sha256,
+            "timestamp": to_iso(self.timestamp),
+            "uploaded_by": self.uploaded_by,
+            "data": self.data,
+        })
+
+
+def migrate_job(job: Dict) -> Tuple[Job, List[Message], List[Quote], List[Photo]]:
+    """Convert a full job dict (as from JobStore.get_job) to records."""
+    return (
+        Job.from_dict(job),
+        [Message.from_dict(m) for m in job.get("messages", [])],
+        [Quote.from_dict(q) for q in job.get("quotes", [])],
+        [Photo.from_dict(p) for p in job.get("photos", [])],
+    )
@@ -0,0 +1,176 @@
+"""Full-text search over jobs, quotes and chat messages (SQLite FTS5).
+
+The indexes are kept current by triggers on the jobs, quotes and messages tables, so
+every save_job, quote change and message append updates them in the same transaction
+and nothing ever needs a rebuild.
+"""
+import html
+import re
+from typing import Dict, List, Tuple
+
+from storage import JOB_COLUMNS, JobStore
+
+SCHEMA = """
+-- One document per job: its own text fields plus all quote breakdowns. jobs has a TEXT
+-- primary key, so its rowids may be renumbered by VACUUM; documents are keyed instead
+-- on job_search_keys, whose INTEGER PRIMARY KEY is stable
+CREATE TABLE IF NOT EXISTS job_search_keys (
+    key INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS job_search USING fts5(
+    job_id UNINDEXED, description, location, category, customer_email, quotes,
+    tokenize = 'porter unicode61', prefix = '2 3'
+);
+-- Messages are indexed in place (external content); rowid = messages.id
+CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+    text, content = 'messages', content_rowid = 'id',
+    tokenize = 'porter unicode61', prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS job_search_ai AFTER INSERT ON jobs BEGIN
+    INSERT INTO job_search_keys (job_id) VALUES (new.id);
+    INSERT INTO job_search (rowid, job_id, description, location, category, customer_email, quotes)
+    VALUES ((SELECT key FROM job_search_keys WHERE job_id = new.id), new.id,
+            new.description, new.location, new.category, new.customer_email,
+            (SELECT group_concat(breakdown, ' ') FROM quotes WHERE job_id = new.id));
+END;
+CREATE TRIGGER IF NOT EXISTS job_search_au
+AFTER UPDATE OF description, location, category, customer_email ON jobs BEGIN
+    UPDATE job_search SET description = new.description, location = new.location,
+        category = new.category, customer_email = new.customer_email
+    WHERE rowid = (SELECT key FROM job_search_keys WHERE job_id = new.id);
+END;
+CREATE TRIGGER IF NOT EXISTS job_search_ad AFTER DELETE ON jobs BEGIN
+    DELETE FROM job_search WHERE rowid = (SELECT key FROM job_search_keys WHERE job_id = old.id);
+    DELETE FROM job_search_keys WHERE job_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS quote_search_ai AFTER INSERT ON quotes BEGIN
+    UPDATE job_search SET quotes = (SELECT group_concat(breakdown, ' ') FROM quotes WHERE job_id = new.job_id)
+    WHERE rowid = (SELECT key FROM job_search_keys WHERE job_id = new.job_id);
+END;
+CREATE TRIGGER IF NOT EXISTS quote_search_au AFTER UPDATE OF breakdown ON quotes BEGIN
+    UPDATE job_search SET quotes = (SELECT group_concat(breakdown, ' ') FROM quotes WHERE job_id = new.job_id)
+    WHERE rowid = (SELECT key FROM job_search_keys WHERE job_id = new.job_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_search_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO message_search (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS message_search_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO message_search (message_search, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Hits ranked per source (job fields, messages) before grouping by job
+MAX_CANDIDATES = 2000
+
+# Search terms: words, emails and ids; everything else (FTS5 operators included) is dropped
+_TERM = re.compile(r"[\w@.\-]+", re.UNICODE)
+
+
+def to_match_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every term must match, the last one as a prefix."""
+    terms = [t.strip(".-") for t in _TERM.findall(text)]
+    terms = [t.replace('"', "") for t in terms if t]
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def highlight(snippet: str) -> str:
+    """Escape a search snippet for HTML and wrap the matched terms in <mark>."""
+    return html.escape(snippet or "").replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+
+class SearchIndex:
+    def __init__(self, store: JobStore):
+        self.store = store
+        conn = store.conn
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(job_search)")]
+        is_new = "job_id" not in columns
+        if columns and is_new:
+            # The first version keyed job documents on jobs.rowid; replace it
+            conn.executescript(
+                "DROP TRIGGER IF EXISTS job_search_ai; DROP TRIGGER IF EXISTS job_search_au;"
+                " DROP TRIGGER IF EXISTS job_search_ad; DROP TRIGGER IF EXISTS quote_search_ai;"
+                " DROP TRIGGER IF EXISTS quote_search_au; DROP TABLE job_search;"
+            )
+        conn.executescript(SCHEMA)
+        if is_new:
+            self.rebuild()
+        store.search = self
+
+    def rebuild(self):
+        """Re-index everything from the base tables (only needed for pre-existing data)."""
+        with self.store._tx() as conn:
+            conn.execute("DELETE FROM job_search")
+            conn.execute("DELETE FROM job_search_keys")
+            conn.execute("INSERT INTO job_search_keys (job_id) SELECT id FROM jobs")
+            conn.execute(
+                "INSERT INTO job_search (rowid, job_id, description, location, category, customer_email, quotes) "
+                "SELECT k.key, j.id, j.description, j.location, j.category, j.customer_email,"
+                " (SELECT group_concat(breakdown, ' ') FROM quotes WHERE job_id = j.id) "
+                "FROM jobs j JOIN job_search_keys k ON k.job_id = j.id"
+            )
+            conn.execute("INSERT INTO message_search (message_search) VALUES ('rebuild')")
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """Jobs matching `text` in their fields, quotes or messages, best match first.
+
+        Returns (page, total). Very common terms are ranked over the newest
+        MAX_CANDIDATES hits per source, so `total` is capped accordingly. Each result is the job row plus `snippet`, an excerpt of
+        the best-matching text; pass it to highlight() for display.
+        """
+        query = to_match_query(text)
+        if not query:
+            return [], 0
+        # bm25 costs ~1 µs per hit, so a term in every chat message would take hundreds
+        # of ms to rank. Rank only the newest MAX_CANDIDATES hits per table (FTS5 walks
+        # rowids in order and scores just the rows it returns), then keep each job's best
+        # hit; SQLite fills the bare src/rid columns from the row that produced MIN(score).
+        ranked = """
+            WITH hits AS (
+                SELECT * FROM (
+                    SELECT job_id, bm25(job_search) AS score, 'job' AS src, rowid AS rid
+                    FROM job_search
+                    WHERE job_search MATCH :q ORDER BY rowid DESC LIMIT :cap
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT m.job_id, bm25(message_search), 'message', message_search.rowid
+                    FROM message_search JOIN messages m ON m.id = message_search.rowid
+                    WHERE message_search MATCH :q ORDER BY message_search.rowid DESC LIMIT :cap
+                )
+            )
+            SELECT job_id, MIN(score) AS score, src, rid FROM hits GROUP BY job_id
+        """
+        conn = self.store.conn
+        page = conn.execute(
+            f"SELECT *, COUNT(*) OVER () AS total FROM ({ranked}) ORDER BY score LIMIT :limit OFFSET :offset",
+            {"q": query, "cap": MAX_CANDIDATES, "limit": limit, "offset": offset},
+        ).fetchall()
+        if page:
+            total = page[0]["total"]
+        else:
+            total = conn.execute(f"SELECT COUNT(*) FROM ({ranked})", {"q": query, "cap": MAX_CANDIDATES}).fetchone()[0]
+
+        # Then snippets and job rows for just this page
+        results = []
+        for hit in page:
+            table, column = ("job_search", -1) if hit["src"] == "job" else ("message_search", 0)
+            snippet = conn.execute(
+                f"SELECT snippet({table}, {column}, char(2), char(3), '…', 12) FROM {table} "
+                f"WHERE {table} MATCH ? AND rowid = ?",
+                (query, hit["rid"]),
+            ).fetchone()
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (hit["job_id"],)).fetchone()
+            results.append({
+                **{col: job[col] for col in JOB_COLUMNS},
+                "score": hit["score"],
+                "snippet": snippet[0] if snippet else "",
+            })
+        return results, total
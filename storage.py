@@ -0,0 +1,846 @@
+"""SQLite-backed job store shared by every Streamlit session and server process."""
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+DATA_DIR = os.environ.get("FIXSYNC_DATA_DIR", "data")
+DB_PATH = os.environ.get("FIXSYNC_DB", os.path.join(DATA_DIR, "fixsync.db"))
+
+JOB_COLUMNS = [
+    "id", "customer_email", "created", "status", "assigned_tech",
+    "priority", "category", "location", "description",
+]
+# Denormalized per-job counters kept in step with the child tables, so listings can
+# filter and sort on them through indexes instead of aggregating
+COUNTER_COLUMNS = ["photo_count", "message_count", "quote_count", "max_quote"]
+MESSAGE_COLUMNS = ["type", "role", "text", "sender", "time", "timestamp"]
+QUOTE_COLUMNS = [
+    "id", "amount", "breakdown", "timeline", "warranty",
+    "technician", "created", "status",
+]
+# "data" holds legacy inline base64 photos until they are migrated to the blob store
+PHOTO_COLUMNS = [
+    "data", "sha256", "content_type", "size", "width", "height",
+    "thumb_sha256", "preview_sha256", "timestamp", "uploaded_by",
+]
+VIDEO_COLUMNS = [
+    "sha256", "content_type", "size", "duration", "width", "height",
+    "poster_sha256", "name", "timestamp", "uploaded_by",
+]
+
+# Dispatch order: emergency first, then high, medium, low. The same expression is used in
+# the queue indexes and queries so SQLite can walk the index instead of sorting.
+PRIORITY_RANK = (
+    "(CASE priority WHEN 'emergency' THEN 0 WHEN 'high' THEN 1 WHEN 'medium' THEN 2 ELSE 3 END)"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    customer_email TEXT,
+    created TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open',
+    assigned_tech TEXT,
+    priority TEXT NOT NULL DEFAULT 'medium',
+    category TEXT,
+    location TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    photo_count INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    quote_count INTEGER NOT NULL DEFAULT 0,
+    max_quote REAL,
+    version INTEGER NOT NULL DEFAULT 0,
+    completed TEXT,
+    closed TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_assigned_tech ON jobs(assigned_tech);
+CREATE INDEX IF NOT EXISTS idx_jobs_customer_email ON jobs(customer_email);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created);
+CREATE INDEX IF NOT EXISTS idx_jobs_category ON jobs(category);
+CREATE INDEX IF NOT EXISTS idx_jobs_priority ON jobs(priority);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_max_quote ON jobs(max_quote);
+CREATE INDEX IF NOT EXISTS idx_jobs_message_count ON jobs(message_count);
+CREATE INDEX IF NOT EXISTS idx_jobs_dispatch ON jobs(""" + PRIORITY_RANK + """, created)
+    WHERE status = 'open' AND assigned_tech IS NULL;
+CREATE INDEX IF NOT EXISTS idx_jobs_dispatch_category ON jobs(category, """ + PRIORITY_RANK + """, created)
+    WHERE status = 'open' AND assigned_tech IS NULL;
+
+-- When a job was completed, for turnaround reporting; cleared if it is reopened
+CREATE TRIGGER IF NOT EXISTS jobs_completed_ai AFTER INSERT ON jobs
+WHEN new.status = 'completed' AND new.completed IS NULL BEGIN
+    UPDATE jobs SET completed = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS jobs_completed_au AFTER UPDATE OF status ON jobs
+WHEN new.status IS NOT old.status BEGIN
+    UPDATE jobs SET completed = CASE WHEN new.status = 'completed'
+        THEN strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') END
+    WHERE id = new.id;
+END;
+
+-- When a job entered a closed status (completed or cancelled), for archiving
+CREATE TRIGGER IF NOT EXISTS jobs_closed_ai AFTER INSERT ON jobs
+WHEN new.status IN ('completed', 'cancelled') AND new.closed IS NULL BEGIN
+    UPDATE jobs SET closed = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS jobs_closed_au AFTER UPDATE OF status ON jobs
+WHEN new.status IS NOT old.status BEGIN
+    UPDATE jobs SET closed = CASE WHEN new.status IN ('completed', 'cancelled')
+        THEN strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') END
+    WHERE id = new.id;
+END;
+CREATE INDEX IF NOT EXISTS idx_jobs_closed ON jobs(closed) WHERE closed IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    type TEXT,
+    role TEXT,
+    text TEXT NOT NULL,
+    sender TEXT,
+    time TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_job ON messages(job_id, id);
+
+CREATE TABLE IF NOT EXISTS quotes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    amount REAL NOT NULL DEFAULT 0,
+    breakdown TEXT,
+    timeline TEXT,
+    warranty TEXT,
+    technician TEXT,
+    created TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    UNIQUE (job_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_quotes_status ON quotes(status);
+
+CREATE TABLE IF NOT EXISTS photos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    data TEXT,
+    sha256 TEXT,
+    content_type TEXT,
+    size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    thumb_sha256 TEXT,
+    preview_sha256 TEXT,
+    timestamp TEXT,
+    uploaded_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_photos_job ON photos(job_id, id);
+CREATE INDEX IF NOT EXISTS idx_photos_sha256 ON photos(sha256);
+
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    sha256 TEXT NOT NULL,
+    content_type TEXT,
+    size INTEGER,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    poster_sha256 TEXT,
+    name TEXT,
+    timestamp TEXT,
+    uploaded_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_videos_job ON videos(job_id, id);
+CREATE INDEX IF NOT EXISTS idx_videos_sha256 ON videos(sha256);
+
+-- Materialized dashboard counters: scope is 'all', 'category' or 'tech'
+CREATE TABLE IF NOT EXISTS metrics (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key, name)
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+"""
+
+# Columns added after a table was first shipped: (table, column, type)
+MIGRATIONS = [
+    ("jobs", "photo_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "message_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "quote_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "max_quote", "REAL"),
+    ("jobs", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "completed", "TEXT"),
+    ("jobs", "closed", "TEXT"),
+    ("photos", "sha256", "TEXT"),
+    ("photos", "content_type", "TEXT"),
+    ("photos", "size", "INTEGER"),
+    ("photos", "width", "INTEGER"),
+    ("photos", "height", "INTEGER"),
+    ("photos", "thumb_sha256", "TEXT"),
+    ("photos", "preview_sha256", "TEXT"),
+]
+
+
+MetricKey = Tuple[str, str, str]
+
+
+def _job_metrics(job: Optional[sqlite3.Row], approved: List[sqlite3.Row]) -> Dict[MetricKey, float]:
+    """What one job contributes to the metrics table.
+
+    Job and status counts go to the job's category and assigned technician; approved
+    quote revenue goes to the job's category and the quoting technician.
+    """
+    out: Dict[MetricKey, float] = defaultdict(float)
+    if job is None:
+        return out
+    status, category, tech = job["status"], job["category"] or "", job["assigned_tech"]
+    scopes = [("all", ""), ("category", category)] + ([("tech", tech)] if tech else [])
+    for scope, key in scopes:
+        out[(scope, key, "jobs")] += 1
+        out[(scope, key, f"status:{status}")] += 1
+    for quote in approved:
+        for scope, key in [("all", ""), ("category", category), ("tech", quote["technician"] or "")]:
+            out[(scope, key, "revenue")] += quote["amount"]
+            out[(scope, key, "approved_quotes")] += 1
+    return out
+
+
+def _row_to_dict(row: sqlite3.Row, columns: List[str]) -> Dict:
+    # Drop NULL columns so records keep the sparse shape the UI was written against
+    return {col: row[col] for col in columns if row[col] is not None}
+
+
+class JobStore:
+    """Durable job storage. Jobs are rows; messages, quotes and photos are child rows."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        # Optional event bus (see events.py); writes publish through it inside their transaction
+        self.bus = None
+        # Optional cold storage (see archive.py); its rollups count toward get_metrics
+        self.archive = None
+        self._migrate()
+
+    def _migrate(self):
+        conn = self.conn
+        had_metrics = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metrics'"
+        ).fetchone() is not None
+        existing = {}
+        for table in {m[0] for m in MIGRATIONS}:
+            existing[table] = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        added = set()
+        with self._tx():
+            for table, column, col_type in MIGRATIONS:
+                if existing[table] and column not in existing[table]:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+                    added.add((table, column))
+            if any(table == "jobs" and column in COUNTER_COLUMNS for table, column in added):
+                conn.execute(
+                    "UPDATE jobs SET"
+                    " photo_count = (SELECT COUNT(*) FROM photos WHERE job_id = jobs.id),"
+                    " message_count = (SELECT COUNT(*) FROM messages WHERE job_id = jobs.id),"
+                    " quote_count = (SELECT COUNT(*) FROM quotes WHERE job_id = jobs.id),"
+                    " max_quote = (SELECT MAX(amount) FROM quotes WHERE job_id = jobs.id)"
+                )
+            if ("jobs", "closed") in added:
+                # Closed before the column existed: from completion if known, else from now
+                conn.execute(
+                    "UPDATE jobs SET closed = COALESCE(completed, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))"
+                    " WHERE status IN ('completed', 'cancelled')"
+                )
+        conn.executescript(SCHEMA)
+        if not had_metrics:
+            self.rebuild_metrics()
+
+    # Each Streamlit session runs in its own thread, so each thread gets its own connection
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self.conn
+        if conn.in_transaction:
+            # Nested call inside an outer transaction
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.pending = []
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._local.pending = []
+            raise
+        conn.execute("COMMIT")
+        pending, self._local.pending = self._local.pending, []
+        # In-process subscribers only hear about changes that actually committed
+        for event in pending:
+            self.bus.dispatch(event)
+
+    @contextmanager
+    def _job_tx(self, job_id: str):
+        """A transaction that applies the job's metric deltas when the outermost write ends."""
+        tracked = self._local.__dict__.setdefault("metric_jobs", set())
+        with self._tx() as conn:
+            if job_id in tracked:
+                yield conn
+                return
+            tracked.add(job_id)
+            try:
+                before = self._metrics_for_job(conn, job_id)
+                yield conn
+                after = self._metrics_for_job(conn, job_id)
+                self._apply_metric_delta(conn, before, after)
+            finally:
+                tracked.discard(job_id)
+
+    def _metrics_for_job(self, conn: sqlite3.Connection, job_id: str) -> Dict[MetricKey, float]:
+        job = conn.execute(
+            "SELECT status, category, assigned_tech FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        approved = conn.execute(
+            "SELECT amount, technician FROM quotes WHERE job_id = ? AND status = 'approved'", (job_id,)
+        ).fetchall() if job else []
+        return _job_metrics(job, approved)
+
+    def _apply_metric_delta(self, conn: sqlite3.Connection, before: Dict, after: Dict):
+        for key in set(before) | set(after):
+            delta = after.get(key, 0) - before.get(key, 0)
+            if delta:
+                conn.execute(
+                    "INSERT INTO metrics (scope, key, name, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(scope, key, name) DO UPDATE SET value = value + excluded.value",
+                    (*key, delta),
+                )
+
+    def _publish(self, job_id: str, kind: str, **payload):
+        """Record a change to a job in the current transaction: bump its version (which
+        caches in every process compare against) and publish an event."""
+        self.conn.execute("UPDATE jobs SET version = version + 1 WHERE id = ?", (job_id,))
+        if self.bus is not None:
+            self._local.pending.append(self.bus.publish(self.conn, job_id, kind, payload))
+
+    # Jobs
+    def save_job(self, job_id: str, job_data: Dict):
+        """Upsert the job row and append any child records that have not been stored yet."""
+        with self._job_tx(job_id) as conn:
+            values = {col: job_data.get(col) for col in JOB_COLUMNS}
+            values["id"] = job_id
+            values["created"] = values["created"] or datetime.now().isoformat()
+            values["status"] = values["status"] or "open"
+            values["priority"] = values["priority"] or "medium"
+            values["location"] = values["location"] or ""
+            values["description"] = values["description"] or ""
+            # A cleared technician field means unassigned: the dispatch queue matches NULL only
+            values["assigned_tech"] = values["assigned_tech"] or None
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in JOB_COLUMNS)}) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in JOB_COLUMNS[1:]),
+                values,
+            )
+            for msg in job_data.get("messages", []):
+                if "id" not in msg:
+                    msg["id"] = self.append_message(job_id, msg)
+            for photo in job_data.get("photos", []):
+                if "id" not in photo:
+                    photo["id"] = self.add_photo(job_id, photo)
+            for quote in job_data.get("quotes", []):
+                self.add_quote(job_id, quote)
+            self._publish(job_id, "job")
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._assemble([row])[job_id]
+
+    def get_job_summary(self, job_id: str) -> Optional[Dict]:
+        """The job row alone, without loading messages, quotes or photos."""
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return {col: row[col] for col in JOB_COLUMNS} if row else None
+
+    def get_version(self, job_id: str) -> Optional[int]:
+        """The job's change counter, or None if it does not exist. A primary-key lookup."""
+        row = self.conn.execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_messages(
+        self,
+        job_id: str,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Messages in id order. Message ids only ever increase, so they double as cursors:
+        with a limit, the newest `limit` messages in the (after_id, before_id) window are returned."""
+        where, params = ["job_id = ?"], [job_id]
+        if after_id is not None:
+            where.append("id > ?")
+            params.append(after_id)
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(before_id)
+        sql = f"SELECT * FROM messages WHERE {' AND '.join(where)}"
+        if limit is not None:
+            sql += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+            rows = reversed(self.conn.execute(sql, params).fetchall())
+        else:
+            rows = self.conn.execute(sql + " ORDER BY id", params)
+        return [{"id": row["id"], **_row_to_dict(row, MESSAGE_COLUMNS)} for row in rows]
+
+    def has_messages_before(self, job_id: str, message_id: int) -> bool:
+        return self.conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM messages WHERE job_id = ? AND id < ?)",
+            (job_id, message_id),
+        ).fetchone()[0] == 1
+
+    def get_quotes(self, job_id: str) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT * FROM quotes WHERE job_id = ? ORDER BY seq", (job_id,)
+        )
+        return [_row_to_dict(row, QUOTE_COLUMNS) for row in rows]
+
+    def get_milestones(self, job_id: str) -> Dict:
+        """Timestamps of the first message, photo and quote on a job, and of its completion."""
+        row = self.conn.execute(
+            """SELECT
+                (SELECT timestamp FROM messages WHERE job_id = :id AND timestamp IS NOT NULL ORDER BY id LIMIT 1),
+                (SELECT timestamp FROM photos WHERE job_id = :id ORDER BY id LIMIT 1),
+                (SELECT created FROM quotes WHERE job_id = :id ORDER BY seq LIMIT 1),
+                (SELECT completed FROM jobs WHERE id = :id)""",
+            {"id": job_id},
+        ).fetchone()
+        return {"first_message": row[0], "first_photo": row[1], "first_quote": row[2], "completed": row[3]}
+
+    def find_jobs(
+        self,
+        status: Optional[str] = None,
+        assigned_tech: Optional[str] = None,
+        customer_email: Optional[str] = None,
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Job rows matching every given field, oldest first, with child counts.
+
+        Each filter column is indexed (the indexes are maintained by SQLite in the same
+        transaction as every insert, update and delete), so cost follows the result size.
+        """
+        filters = {
+            "status": status,
+            "assigned_tech": assigned_tech,
+            "customer_email": customer_email,
+            "category": category,
+        }
+        where = [f"{col} = :{col}" for col, value in filters.items() if value is not None]
+        sql = "SELECT * FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = self.conn.execute(sql, filters)
+        return [{col: row[col] for col in JOB_COLUMNS + COUNTER_COLUMNS} for row in rows]
+
+    # Sort keys accepted by query_jobs; each maps to an indexed column
+    SORT_COLUMNS = {"created": "created", "max_quote": "max_quote", "message_count": "message_count"}
+
+    @staticmethod
+    def _job_filter(
+        status: Optional[List[str]] = None,
+        category: Optional[List[str]] = None,
+        priority: Optional[List[str]] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+    ) -> Tuple[str, List]:
+        where, params = [], []
+        for col, values in [("status", status), ("category", category), ("priority", priority)]:
+            if values:
+                where.append(f"{col} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if created_from:
+            where.append("created >= ?")
+            params.append(created_from)
+        if created_to:
+            where.append("created < ?")
+            params.append(created_to)
+        return (f" WHERE {' AND '.join(where)}" if where else ""), params
+
+    def count_jobs(self, **filters) -> int:
+        """Number of jobs matching the query_jobs filters."""
+        where_sql, params = self._job_filter(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM jobs{where_sql}", params).fetchone()[0]
+
+    def query_jobs(
+        self,
+        status: Optional[List[str]] = None,
+        category: Optional[List[str]] = None,
+        priority: Optional[List[str]] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+        sort: str = "created",
+        descending: bool = True,
+        limit: int = 50,
+        offset: int = 0,
+        total: Optional[int] = None,
+    ) -> Tuple[List[Dict], int]:
+        """One page of job rows for the admin table, plus the total number of matches.
+
+        Filtering, sorting and paging all happen in SQL; created_from (inclusive) and
+        created_to (exclusive) are ISO dates or timestamps compared against created.
+        Pass a `total` already taken with count_jobs to skip counting again.
+        """
+        where_sql, params = self._job_filter(status, category, priority, created_from, created_to)
+        order = self.SORT_COLUMNS[sort]
+        direction = "DESC" if descending else "ASC"
+        if total is None:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM jobs{where_sql}", params).fetchone()[0]
+        rows = self.conn.execute(
+            f"SELECT * FROM jobs{where_sql} ORDER BY {order} {direction} "
+            "LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        )
+        return [{col: row[col] for col in JOB_COLUMNS + COUNTER_COLUMNS} for row in rows], total
+
+    def update_jobs(self, job_ids: List[str], actor: Optional[str] = None, **fields):
+        """Apply the same field update to several jobs in one transaction."""
+        with self._tx():
+            for job_id in job_ids:
+                self.update_job_fields(job_id, actor=actor, **fields)
+
+    def delete_jobs(self, job_ids: List[str]):
+        with self._tx():
+            for job_id in job_ids:
+                self.delete_job(job_id)
+
+    # Dispatch
+    def dispatch_queue(self, category: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Unassigned open jobs in dispatch order: priority, then oldest first."""
+        where = "status = 'open' AND assigned_tech IS NULL"
+        params: List = []
+        # Pin the partial index: the planner would otherwise pick idx_jobs_status and sort
+        index = "idx_jobs_dispatch"
+        if category is not None:
+            where += " AND category = ?"
+            params.append(category)
+            index = "idx_jobs_dispatch_category"
+        rows = self.conn.execute(
+            f"SELECT * FROM jobs INDEXED BY {index} WHERE {where} "
+            f"ORDER BY {PRIORITY_RANK}, created LIMIT ?",
+            params + [limit],
+        )
+        return [{col: row[col] for col in JOB_COLUMNS + COUNTER_COLUMNS} for row in rows]
+
+    def claim_job(self, job_id: str, tech: str) -> bool:
+        """Assign an open, unassigned job to `tech`. Compare-and-set: returns False if
+        someone else claimed it first, so a job is never assigned twice."""
+        with self._job_tx(job_id) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET assigned_tech = ?, status = 'in_progress' "
+                "WHERE id = ? AND status = 'open' AND assigned_tech IS NULL",
+                (tech, job_id),
+            )
+            if cur.rowcount != 1:
+                return False
+            self._publish(job_id, "claimed", technician=tech)
+            return True
+
+    def claim_next(self, tech: str, category: Optional[str] = None) -> Optional[str]:
+        """Claim the job at the head of the dispatch queue; returns its id, or None if the
+        queue is empty. The write lock is held from the lookup to the update."""
+        with self._tx():
+            head = self.dispatch_queue(category, limit=1)
+            if not head:
+                return None
+            job_id = head[0]["id"]
+            return job_id if self.claim_job(job_id, tech) else None
+
+    def get_all_jobs(self) -> Dict:
+        rows = self.conn.execute("SELECT * FROM jobs ORDER BY created").fetchall()
+        return self._assemble(rows)
+
+    def delete_job(self, job_id: str):
+        with self._job_tx(job_id) as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._publish(job_id, "deleted")
+
+    def update_job_fields(self, job_id: str, actor: Optional[str] = None, **fields):
+        """Update scalar job columns without touching any child records. `actor` (the
+        user's email, or role) goes into the event, so they are not notified of their own change."""
+        unknown = set(fields) - set(JOB_COLUMNS[1:])
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        if not fields:
+            return
+        if "assigned_tech" in fields:
+            fields["assigned_tech"] = fields["assigned_tech"] or None
+        with self._job_tx(job_id) as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{c} = :{c}' for c in fields)} WHERE id = :id",
+                {**fields, "id": job_id},
+            )
+            self._publish(job_id, "job", fields=sorted(fields), actor=actor)
+
+    def _assemble(self, rows: List[sqlite3.Row]) -> Dict:
+        jobs = {}
+        for row in rows:
+            job = {col: row[col] for col in JOB_COLUMNS}
+            job.update(photos=[], messages=[], quotes=[])
+            jobs[row["id"]] = job
+        if not jobs:
+            return jobs
+
+        ids = list(jobs)
+        if len(ids) > 500:
+            # Large batches: one pass per child table instead of a huge IN (...) list
+            where, params = "", []
+        else:
+            where, params = f"WHERE job_id IN ({', '.join('?' * len(ids))})", ids
+        conn = self.conn
+        for row in conn.execute(f"SELECT * FROM messages {where} ORDER BY id", params):
+            if row["job_id"] in jobs:
+                jobs[row["job_id"]]["messages"].append(
+                    {"id": row["id"], **_row_to_dict(row, MESSAGE_COLUMNS)}
+                )
+        for row in conn.execute(f"SELECT * FROM quotes {where} ORDER BY seq", params):
+            if row["job_id"] in jobs:
+                jobs[row["job_id"]]["quotes"].append(_row_to_dict(row, QUOTE_COLUMNS))
+        for row in conn.execute(f"SELECT * FROM photos {where} ORDER BY id", params):
+            if row["job_id"] in jobs:
+                jobs[row["job_id"]]["photos"].append(
+                    {"id": row["id"], **_row_to_dict(row, PHOTO_COLUMNS)}
+                )
+        return jobs
+
+    # Child records
+    def append_message(self, job_id: str, msg: Dict) -> int:
+        with self._tx() as conn:
+            cur = conn.execute(
+                f"INSERT INTO messages (job_id, {', '.join(MESSAGE_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(MESSAGE_COLUMNS))})",
+                [job_id] + [msg.get(col) for col in MESSAGE_COLUMNS],
+            )
+            conn.execute("UPDATE jobs SET message_count = message_count + 1 WHERE id = ?", (job_id,))
+            self._publish(job_id, "message", message_id=cur.lastrowid)
+            return cur.lastrowid
+
+    def add_photo(self, job_id: str, photo: Dict, actor: Optional[str] = None) -> int:
+        """Record a photo already written to the blob store. `actor` is the uploader, as
+        for update_job_fields."""
+        with self._tx() as conn:
+            cur = conn.execute(
+                f"INSERT INTO photos (job_id, {', '.join(PHOTO_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(PHOTO_COLUMNS))})",
+                [job_id] + [photo.get(col) for col in PHOTO_COLUMNS],
+            )
+            conn.execute("UPDATE jobs SET photo_count = photo_count + 1 WHERE id = ?", (job_id,))
+            self._publish(job_id, "photo", photo_id=cur.lastrowid, actor=actor)
+            return cur.lastrowid
+
+    def add_video(self, job_id: str, video: Dict) -> int:
+        """Record a video already written to the blob store; the job only holds the reference."""
+        with self._tx() as conn:
+            cur = conn.execute(
+                f"INSERT INTO videos (job_id, {', '.join(VIDEO_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(VIDEO_COLUMNS))})",
+                [job_id] + [video.get(col) for col in VIDEO_COLUMNS],
+            )
+            self._publish(job_id, "video", video_id=cur.lastrowid)
+            return cur.lastrowid
+
+    def get_videos(self, job_id: str) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT * FROM videos WHERE job_id = ? ORDER BY id DESC", (job_id,)
+        )
+        return [{"id": row["id"], **_row_to_dict(row, VIDEO_COLUMNS)} for row in rows]
+
+    def media_content_type(self, digest: str) -> Optional[str]:
+        """Content type of a blob referenced by any photo or video (or poster, a JPEG),
+        archived videos included."""
+        row = self.conn.execute(
+            "SELECT content_type FROM videos WHERE sha256 = ? "
+            "UNION ALL SELECT 'image/jpeg' FROM videos WHERE poster_sha256 = ? "
+            "UNION ALL SELECT content_type FROM photos WHERE sha256 = ? LIMIT 1",
+            (digest, digest, digest),
+        ).fetchone()
+        if row is None and self.archive is not None:
+            return self.archive.media_content_type(digest)
+        return row[0] if row else None
+
+    def get_photos(self, job_id: str, offset: int = 0, limit: int = 12) -> List[Dict]:
+        """A page of a job's photos, newest first."""
+        rows = self.conn.execute(
+            "SELECT * FROM photos WHERE job_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (job_id, limit, offset),
+        )
+        return [{"id": row["id"], **_row_to_dict(row, PHOTO_COLUMNS)} for row in rows]
+
+    def get_photo(self, photo_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM photos WHERE id = ?", (photo_id,)).fetchone()
+        return {"id": row["id"], **_row_to_dict(row, PHOTO_COLUMNS)} if row else None
+
+    def count_photos(self, job_id: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM photos WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+
+    def photos_missing_derivatives(self) -> List[tuple]:
+        return self.conn.execute(
+            "SELECT id, sha256 FROM photos WHERE sha256 IS NOT NULL AND thumb_sha256 IS NULL"
+        ).fetchall()
+
+    def set_photo_derivatives(self, photo_id: int, thumb_sha256: str, preview_sha256: str):
+        with self._tx() as conn:
+            conn.execute(
+                "UPDATE photos SET thumb_sha256 = ?, preview_sha256 = ? WHERE id = ?",
+                (thumb_sha256, preview_sha256, photo_id),
+            )
+
+    def inline_photos(self) -> List[tuple]:
+        return self.conn.execute(
+            "SELECT id, data FROM photos WHERE data IS NOT NULL AND sha256 IS NULL"
+        ).fetchall()
+
+    def set_photo_blob(self, photo_id: int, sha256: str, size: int):
+        with self._tx() as conn:
+            conn.execute(
+                "UPDATE photos SET sha256 = ?, size = ?, content_type = 'image/jpeg', data = NULL "
+                "WHERE id = ?",
+                (sha256, size, photo_id),
+            )
+
+    def add_quote(self, job_id: str, quote: Dict):
+        """Insert a quote, or update it in place if it already exists."""
+        values = [job_id] + [quote.get(col) for col in QUOTE_COLUMNS]
+        with self._job_tx(job_id) as conn:
+            cur = conn.execute(
+                f"INSERT INTO quotes (job_id, {', '.join(QUOTE_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(QUOTE_COLUMNS))}) "
+                "ON CONFLICT(job_id, id) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in QUOTE_COLUMNS[1:])
+                + " WHERE quotes.status IS NOT excluded.status"
+                " OR quotes.amount IS NOT excluded.amount",
+                values,
+            )
+            if cur.rowcount:
+                conn.execute(
+                    "UPDATE jobs SET"
+                    " quote_count = (SELECT COUNT(*) FROM quotes WHERE job_id = :id),"
+                    " max_quote = (SELECT MAX(amount) FROM quotes WHERE job_id = :id)"
+                    " WHERE id = :id",
+                    {"id": job_id},
+                )
+                self._publish(job_id, "quote", quote_id=quote.get("id"), status=quote.get("status"))
+
+    def set_quote_status(self, job_id: str, quote_id: str, status: str, actor: Optional[str] = None):
+        with self._job_tx(job_id) as conn:
+            conn.execute(
+                "UPDATE quotes SET status = ? WHERE job_id = ? AND id = ?",
+                (status, job_id, quote_id),
+            )
+            self._publish(job_id, "quote", quote_id=quote_id, status=status, actor=actor)
+
+    # Metrics
+    def get_metrics(self, scope: str = "all") -> Dict[str, Dict[str, float]]:
+        """{key: {name: value}} for one scope; the 'all' scope has the single key ''.
+        Archived jobs are included through the cold store's rollups."""
+        out: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for row in self.conn.execute(
+            "SELECT key, name, value FROM metrics WHERE scope = ? AND value != 0", (scope,)
+        ):
+            out[row["key"]][row["name"]] = row["value"]
+        if self.archive is not None:
+            for key, values in self.archive.rollups(scope).items():
+                for name, value in values.items():
+                    out[key][name] = out[key].get(name, 0.0) + value
+        return dict(out)
+
+    def compute_metrics(self) -> Dict[MetricKey, float]:
+        """Recompute every metric from the jobs and quotes tables."""
+        conn = self.conn
+        out: Dict[MetricKey, float] = defaultdict(float)
+        for row in conn.execute(
+            "SELECT status, COALESCE(category, '') AS category, assigned_tech, COUNT(*) AS n "
+            "FROM jobs GROUP BY status, category, assigned_tech"
+        ):
+            scopes = [("all", ""), ("category", row["category"])]
+            if row["assigned_tech"]:
+                scopes.append(("tech", row["assigned_tech"]))
+            for scope, key in scopes:
+                out[(scope, key, "jobs")] += row["n"]
+                out[(scope, key, f"status:{row['status']}")] += row["n"]
+        for row in conn.execute(
+            "SELECT COALESCE(j.category, '') AS category, COALESCE(q.technician, '') AS technician,"
+            " SUM(q.amount) AS revenue, COUNT(*) AS n "
+            "FROM quotes q JOIN jobs j ON j.id = q.job_id WHERE q.status = 'approved' "
+            "GROUP BY j.category, q.technician"
+        ):
+            for scope, key in [("all", ""), ("category", row["category"]), ("tech", row["technician"])]:
+                out[(scope, key, "revenue")] += row["revenue"]
+                out[(scope, key, "approved_quotes")] += row["n"]
+        return out
+
+    def check_metrics(self, tolerance: float = 1e-6) -> Dict[MetricKey, Tuple[float, float]]:
+        """Metrics whose stored value drifted from a full recomputation: {key: (stored, actual)}."""
+        stored = {
+            (r["scope"], r["key"], r["name"]): r["value"]
+            for r in self.conn.execute("SELECT * FROM metrics")
+        }
+        actual = self.compute_metrics()
+        return {
+            key: (stored.get(key, 0.0), actual.get(key, 0.0))
+            for key in set(stored) | set(actual)
+            if abs(stored.get(key, 0.0) - actual.get(key, 0.0)) > tolerance
+        }
+
+    def rebuild_metrics(self):
+        with self._tx() as conn:
+            actual = self.compute_metrics()
+            conn.execute("DELETE FROM metrics")
+            conn.executemany(
+                "INSERT INTO metrics (scope, key, name, value) VALUES (?, ?, ?, ?)",
+                [(*key, value) for key, value in actual.items() if value],
+            )
+
+    # Users
+    def add_user(self, email: str, password: str, role: str):
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO users (email, password, role, created) VALUES (?, ?, ?, ?)",
+                (email, password, role, datetime.now().isoformat()),
+            )
+
+    def get_user(self, email: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return dict(row) if row else None
+
+    def authenticate(self, email: str, password: str) -> bool:
+        user = self.get_user(email)
+        return bool(user) and user["password"] == password
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Module-level defaults (DATA_DIR and the paths under it) are read at import time
+os.environ.setdefault("FIXSYNC_DATA_DIR", tempfile.mkdtemp(prefix="fixsync-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
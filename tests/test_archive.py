@@ -0,0 +1,31 @@
+import os
+
+from analytics import Analytics, report
+from archive import ColdStore
+from events import EventBus
+from storage import JobStore
+
+
+def test_analytics_include_archived_jobs(tmp_path):
+    store = JobStore(os.path.join(tmp_path, "archive.db"))
+    EventBus(store)
+    cold = ColdStore(store, os.path.join(tmp_path, "archive"))
+    for i, status in enumerate(["completed", "completed", "open"]):
+        store.save_job(f"J{i}", {
+            "customer_email": "c@example.com", "status": status, "created": "2020-01-01T09:00:00",
+            "messages": [{"text": "Hello", "role": "customer", "timestamp": "2020-01-01T10:00:00"}],
+        })
+        store.add_quote(f"J{i}", {"id": "q1", "amount": 100.0 * (i + 1), "technician": "t@example.com",
+                                  "status": "approved", "created": "2020-01-01T12:00:00"})
+    analytics = Analytics(store, bus=store.bus)
+    before = report(*analytics.snapshot())
+
+    store.conn.execute("UPDATE jobs SET closed = '2020-01-03T00:00:00' WHERE closed IS NOT NULL")
+    assert cold.archive(90) == 2
+
+    for after in (report(*analytics.snapshot()), report(*Analytics(store, bus=store.bus).snapshot())):
+        assert after["jobs"] == before["jobs"] == 3
+        assert after["revenue"] == before["revenue"] == store.get_metrics()[""]["revenue"] == 600.0
+        assert after["approval_rate"] == before["approval_rate"]
+        assert after["time_to_first_quote"] == before["time_to_first_quote"]
+        assert after["time_to_first_message"] == before["time_to_first_message"]
@@ -0,0 +1,63 @@
+import os
+import time
+
+from events import EventBus
+from notify import Channel, Notifier
+from storage import JobStore
+
+
+class RecordingChannel(Channel):
+    name = "recording"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, recipient, subject, body, items):
+        self.sent.append((recipient, [(item["kind"], item["text"]) for item in items]))
+
+
+def make_notifier(tmp_path):
+    store = JobStore(os.path.join(tmp_path, "notify.db"))
+    EventBus(store)
+    channel = RecordingChannel()
+    notifier = Notifier(store, channels=[channel], coalesce_seconds=0)
+    notifier.collect()
+    store.save_job("J1", {"customer_email": "c@example.com", "assigned_tech": "t@example.com"})
+    return store, notifier, channel
+
+
+def deliver(notifier, channel):
+    channel.sent.clear()
+    notifier.collect()
+    notifier.deliver(now=time.time() + 1)
+    return sorted(channel.sent)
+
+
+def test_nobody_is_notified_of_their_own_change(tmp_path):
+    store, notifier, channel = make_notifier(tmp_path)
+
+    store.add_photo("J1", {"sha256": "a" * 64, "uploaded_by": "technician"}, actor="t@example.com")
+    assert deliver(notifier, channel) == []
+
+    store.add_photo("J1", {"sha256": "b" * 64, "uploaded_by": "customer"}, actor="customer")
+    assert deliver(notifier, channel) == [("t@example.com", [("photo", "Job #J1: a new photo was added")])]
+
+    store.update_job_fields("J1", status="in_progress", actor="t@example.com")
+    assert deliver(notifier, channel) == [("c@example.com", [("status", "Job #J1: status is now in progress")])]
+
+    store.add_quote("J1", {"id": "q1", "amount": 50.0, "technician": "t@example.com", "status": "pending"})
+    store.set_quote_status("J1", "q1", "approved", actor="customer")
+    assert deliver(notifier, channel) == [
+        ("c@example.com", [("quote", "Job #J1: new quote for $50.00")]),
+        ("t@example.com", [("quote_decision", "Job #J1: your $50.00 quote was approved")]),
+    ]
+
+
+def test_changes_without_an_actor_reach_both_parties(tmp_path):
+    store, notifier, channel = make_notifier(tmp_path)
+    store.update_job_fields("J1", status="completed", actor="admin")
+    text = "Job #J1: status is now completed"
+    assert deliver(notifier, channel) == [
+        ("c@example.com", [("status", text)]),
+        ("t@example.com", [("status", text)]),
+    ]
@@ -0,0 +1,41 @@
+import pytest
+
+from records import SCHEMA_VERSION, Job, Message, Record, Status, migrate_job
+from storage import JobStore
+
+
+def test_migrate_job_round_trip(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.save_job("J1", {
+        "customer_email": "c@example.com", "status": "quoted", "priority": "high",
+        "category": "HVAC", "created": "2026-10-16T22:40:18.913000", "description": "Furnace rattles",
+        "messages": [{"type": "chat", "text": "héllo", "role": "customer", "sender": "c@example.com",
+                      "time": "10:41 PM", "timestamp": "2026-10-16T22:41:00"}],
+    })
+    store.add_quote("J1", {"id": "q1", "amount": 120.5, "technician": "t@example.com", "status": "pending"})
+    store.add_photo("J1", {"sha256": "ab" * 32, "content_type": "image/jpeg", "size": 10,
+                           "width": 4, "height": 3, "timestamp": "2026-10-16T22:42:00"})
+
+    job = store.get_job("J1")
+    record, messages, quotes, photos = migrate_job(job)
+    assert record.status is Status.QUOTED
+    for original, rec in [(store.get_job_summary("J1"), record)] + list(zip(job["quotes"], quotes)):
+        assert Record.unpack(rec.pack()).to_dict() == original
+    for original, rec in zip(job["messages"] + job["photos"], messages + photos):
+        unpacked = Record.unpack(rec.pack()).to_dict()
+        assert unpacked == {k: v for k, v in original.items() if v is not None and k != "data"}
+
+
+def test_unknown_values_are_kept_when_packed():
+    job = Job.from_dict({"id": "J1", "status": "on_hold", "created": "last week", "category": "HVAC"})
+    assert Record.unpack(job.pack()) == job
+    assert job.to_dict()["status"] == "on_hold"
+    message = Message.from_dict({"id": 1, "text": "hi"})
+    assert Record.unpack(message.pack()).to_dict() == {"id": 1, "text": "hi"}
+
+
+def test_unpack_rejects_other_schema_versions():
+    data = bytearray(Job(id="J1").pack())
+    data[0] = SCHEMA_VERSION + 1
+    with pytest.raises(ValueError):
+        Record.unpack(bytes(data))
@@ -0,0 +1,51 @@
+import os
+
+from archive import ColdStore
+from media import BlobStore
+from storage import JobStore
+from transfer import export_jobs, import_jobs
+
+
+def make_store(root, name):
+    store = JobStore(os.path.join(root, f"{name}.db"))
+    ColdStore(store, os.path.join(root, f"{name}-archive"))
+    return store, BlobStore(os.path.join(root, f"{name}-blobs"))
+
+
+def test_archived_job_round_trip(tmp_path):
+    source, source_blobs = make_store(tmp_path, "source")
+    source.save_job("J1", {
+        "customer_email": "c@example.com", "assigned_tech": "t@example.com",
+        "status": "completed", "created": "2020-01-01T09:00:00", "description": "Leaking tap",
+        "messages": [{"text": "Fixed", "role": "technician", "sender": "t@example.com"}],
+    })
+    # No breakdown, timeline or warranty: the archived frame leaves those keys out
+    source.add_quote("J1", {"id": "q1", "amount": 80.0, "technician": "t@example.com", "status": "approved"})
+    video = source_blobs.put(b"video bytes")
+    source.add_video("J1", {"sha256": video, "content_type": "video/mp4", "name": "tap.mp4"})
+    source.save_job("J2", {"customer_email": "d@example.com", "status": "open", "description": "Live job"})
+    source.conn.execute("UPDATE jobs SET closed = '2020-01-02T00:00:00' WHERE id = 'J1'")
+    assert source.archive.archive(90) == 1
+
+    export = tmp_path / "export"
+    export.mkdir()
+    manifest = export_jobs(source, str(export), blobs=source_blobs)
+    assert manifest["counts"]["jobs"] == 1
+    assert manifest["counts"]["archived"] == 1
+
+    target, target_blobs = make_store(tmp_path, "target")
+    inserted = import_jobs(target, str(export), blobs=target_blobs)
+    assert inserted["jobs"] == 1 and inserted["archived"] == 1
+
+    assert target.get_job("J1") is None
+    job = target.archive.get("J1")
+    assert job["status"] == "completed"
+    assert job["quotes"] == [{"id": "q1", "amount": 80.0, "technician": "t@example.com", "status": "approved"}]
+    assert [m["text"] for m in job["messages"]] == ["Fixed"]
+    assert target_blobs.get(video) == b"video bytes"
+    assert target.media_content_type(video) == "video/mp4"
+    assert target.get_metrics() == source.get_metrics()
+    assert not target.check_metrics()
+
+    # Importing again, or into a store where the job is already archived, adds nothing
+    assert sum(import_jobs(target, str(export), blobs=target_blobs).values()) == 0
@@ -0,0 +1,485 @@
+"""Streaming bulk export and import of jobs with their media.
+
+An export is a directory:
+
+    manifest.json          format version, export id, row counts
+    jobs.ndjson            one JSON object per line, per table
+    quotes.ndjson
+    messages.ndjson
+    photos.ndjson
+    videos.ndjson
+    archived.ndjson        archived jobs, one full job (with its child rows) per line
+    media/ab/cd/abcd...    every referenced blob, laid out like the blob store
+    *.parquet              optional columnar copies of the tables, for analysis
+
+Both directions stream: rows are read with fetchmany and written line by line, and
+files are copied in chunks, so memory use does not grow with the data. The export
+reads one consistent snapshot (a single read transaction); the manifest is written
+last, so a directory without one is an incomplete export.
+
+Import applies each batch of lines in one transaction together with its position in
+the file (the `transfer_progress` table), so an interrupted import picks up after the
+last committed batch and never applies a line twice. Jobs whose id already exists
+are left alone, along with their messages, quotes and media rows, and so are jobs
+already archived here. Message, photo and video ids are assigned by the target
+database. Archived jobs are imported like live ones and moved straight back to cold
+storage, so their metrics land in the archive rollups.
+
+    python transfer.py export data/exports/nightly [--parquet]
+    python transfer.py import data/exports/nightly
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    # Optional: Parquet copies of the exported tables
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORTED = True
+except ImportError:
+    PARQUET_SUPPORTED = False
+
+from archive import ARCHIVE_DIR, ColdStore, _read_frame
+from media import BlobStore
+from storage import (
+    DATA_DIR, JOB_COLUMNS, MESSAGE_COLUMNS, PHOTO_COLUMNS, QUOTE_COLUMNS, VIDEO_COLUMNS, JobStore,
+)
+
+FORMAT_VERSION = 1
+EXPORT_DIR = os.environ.get("FIXSYNC_EXPORT_DIR", os.path.join(DATA_DIR, "exports"))
+BATCH_SIZE = 1000
+
+# (file name, table, exported columns, order), in import order: children after their jobs
+TABLES = [
+    ("jobs", "jobs", JOB_COLUMNS + ["completed", "closed"], "rowid"),
+    ("quotes", "quotes", ["job_id"] + QUOTE_COLUMNS, "seq"),
+    ("messages", "messages", ["id", "job_id"] + MESSAGE_COLUMNS, "id"),
+    ("photos", "photos", ["id", "job_id"] + PHOTO_COLUMNS, "id"),
+    ("videos", "videos", ["id", "job_id"] + VIDEO_COLUMNS, "id"),
+]
+# Archived jobs go in their own file, after the live tables (no Parquet copy: rows are nested)
+ARCHIVED = "archived"
+ARCHIVED_CHILDREN = ["quotes", "messages", "photos", "videos"]
+# Columns of each file that hold blob digests
+MEDIA_COLUMNS = {
+    "photos": ["sha256", "thumb_sha256", "preview_sha256"],
+    "videos": ["sha256", "poster_sha256"],
+}
+
+SCHEMA = """
+-- How far each file of each export has been imported: a byte offset into the file
+CREATE TABLE IF NOT EXISTS transfer_progress (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, name)
+);
+-- Jobs of an export that already existed here; their child rows are skipped too
+CREATE TABLE IF NOT EXISTS transfer_skipped (
+    source TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    PRIMARY KEY (source, job_id)
+);
+"""
+
+Progress = Callable[[str, int, int], None]
+
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64"}
+
+
+def _rows(conn: sqlite3.Connection, sql: str, batch_size: int) -> Iterator[List[tuple]]:
+    cur = conn.execute(sql)
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def _copy_file(src: str, target: str):
+    """Copy src to target through a temp file, so target is never left half-written."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _export_media(blobs: BlobStore, exported: BlobStore, manifest: Dict, name: str, records: List[Dict]):
+    for record in records:
+        for col in MEDIA_COLUMNS.get(name, []):
+            digest = record.get(col)
+            if not digest or exported.exists(digest):
+                continue
+            if blobs.exists(digest):
+                _copy_file(blobs.path(digest), exported.path(digest))
+                manifest["media"] += 1
+            else:
+                manifest["missing_media"] += 1
+
+
+def _arrow_schema(conn: sqlite3.Connection, table: str, columns: List[str]):
+    declared = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    return pa.schema([(col, _ARROW_TYPES.get(declared.get(col), "string")) for col in columns])
+
+
+def export_jobs(
+    store: JobStore,
+    path: str,
+    blobs: Optional[BlobStore] = None,
+    parquet: bool = False,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Progress] = None,
+) -> Dict:
+    """Write every job, quote, message, photo and video, plus their media, to `path`.
+
+    Returns the manifest. `progress(name, rows_written, rows_total)` is called after
+    each batch.
+    """
+    if parquet and not PARQUET_SUPPORTED:
+        raise RuntimeError("Parquet export needs pyarrow")
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        raise FileExistsError(f"{path} already holds an export")
+    blobs = blobs or BlobStore()
+    exported = BlobStore(os.path.join(path, "media"))
+    manifest = {
+        "format": FORMAT_VERSION,
+        "id": uuid.uuid4().hex,
+        "created": datetime.now().isoformat(),
+        "counts": {},
+        "media": 0,
+        "missing_media": 0,
+        "parquet": parquet,
+    }
+
+    # A connection of our own, so the snapshot's read transaction never blocks the
+    # store's writers on this thread
+    conn = sqlite3.connect(f"file:{os.path.abspath(store.path)}?mode=ro", uri=True, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        for name, table, columns, order in TABLES:
+            total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            written = 0
+            writer = None
+            try:
+                if parquet:
+                    schema = _arrow_schema(conn, table, columns)
+                    writer = pq.ParquetWriter(os.path.join(path, f"{name}.parquet"), schema)
+                with open(os.path.join(path, f"{name}.ndjson"), "w", encoding="utf-8") as f:
+                    sql = f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order}"
+                    for batch in _rows(conn, sql, batch_size):
+                        records = [dict(zip(columns, row)) for row in batch]
+                        f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                        if writer is not None:
+                            writer.write_table(pa.Table.from_pylist(records, schema=schema))
+                        _export_media(blobs, exported, manifest, name, records)
+                        written += len(batch)
+                        if progress:
+                            progress(name, written, total)
+            finally:
+                if writer is not None:
+                    writer.close()
+            manifest["counts"][name] = written
+        manifest["counts"][ARCHIVED] = _export_archived(conn, store, path, blobs, exported, manifest, batch_size, progress)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    tmp = os.path.join(path, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+    return manifest
+
+
+def _export_archived(conn: sqlite3.Connection, store: JobStore, path: str, blobs: BlobStore,
+                     exported: BlobStore, manifest: Dict, batch_size: int, progress: Optional[Progress]) -> int:
+    """Write each archived job, read back from its frame, as one line of archived.ndjson."""
+    has_archive = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archived_jobs'").fetchone()
+    total = conn.execute("SELECT COUNT(*) FROM archived_jobs").fetchone()[0] if has_archive else 0
+    root = store.archive.root if store.archive is not None else ARCHIVE_DIR
+    written = 0
+    with open(os.path.join(path, f"{ARCHIVED}.ndjson"), "w", encoding="utf-8") as f:
+        if not total:
+            return 0
+        sql = "SELECT segment, offset, length, codec FROM archived_jobs ORDER BY archived, id"
+        for batch in _rows(conn, sql, batch_size):
+            jobs = [json.loads(_read_frame(os.path.join(root, segment), offset, length, codec))
+                    for segment, offset, length, codec in batch]
+            f.writelines(json.dumps(job, ensure_ascii=False) + "\n" for job in jobs)
+            for name in ("photos", "videos"):
+                _export_media(blobs, exported, manifest, name, [row for job in jobs for row in job.get(name, [])])
+            written += len(batch)
+            if progress:
+                progress(ARCHIVED, written, total)
+    return written
+
+
+def read_manifest(path: str) -> Dict:
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{path} is not a complete export (no manifest.json)") from None
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported export format {manifest.get('format')!r}")
+    return manifest
+
+
+def import_status(store: JobStore, path: str) -> Dict[str, Dict]:
+    """Per-file progress of importing the export at `path`: {name: {"rows", "done"}}."""
+    store.conn.executescript(SCHEMA)
+    manifest = read_manifest(path)
+    rows = store.conn.execute(
+        "SELECT name, rows, done FROM transfer_progress WHERE source = ?", (manifest["id"],)
+    )
+    return {row["name"]: {"rows": row["rows"], "done": bool(row["done"])} for row in rows}
+
+
+def _metrics(store: JobStore, conn: sqlite3.Connection, job_ids) -> Dict:
+    total = defaultdict(float)
+    for job_id in job_ids:
+        for key, value in store._metrics_for_job(conn, job_id).items():
+            total[key] += value
+    return total
+
+
+def _insert(store: JobStore, conn: sqlite3.Connection, name: str, source: str, records: List[Dict]) -> int:
+    """Apply one batch of an export file; the caller holds the transaction."""
+    if name == "jobs":
+        ids = [record["id"] for record in records]
+        archived = {
+            row[0] for row in conn.execute(
+                f"SELECT id FROM archived_jobs WHERE id IN ({', '.join('?' * len(ids))})", ids
+            )
+        }
+        inserted = []
+        for record in records:
+            if record["id"] in archived:
+                # Restoring it would bring back a live copy of a job that is in cold storage
+                cur = None
+            else:
+                cur = conn.execute(
+                    f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}, completed, closed) "
+                    f"VALUES ({', '.join(':' + c for c in JOB_COLUMNS)}, :completed, :closed) ON CONFLICT(id) DO NOTHING",
+                    {"completed": None, "closed": None, **record},
+                )
+            if cur is not None and cur.rowcount:
+                inserted.append(record["id"])
+            else:
+                conn.execute(
+                    "INSERT OR IGNORE INTO transfer_skipped (source, job_id) VALUES (?, ?)",
+                    (source, record["id"]),
+                )
+        store._apply_metric_delta(conn, {}, _metrics(store, conn, inserted))
+        for job_id in inserted:
+            store._publish(job_id, "import")
+        return len(inserted)
+
+    job_ids = sorted({record["job_id"] for record in records})
+    skipped = {
+        row[0] for row in conn.execute(
+            f"SELECT job_id FROM transfer_skipped WHERE source = ? AND job_id IN ({', '.join('?' * len(job_ids))})",
+            [source] + job_ids,
+        )
+    }
+    records = [record for record in records if record["job_id"] not in skipped]
+    job_ids = [job_id for job_id in job_ids if job_id not in skipped]
+    if not records:
+        return 0
+
+    if name == "quotes":
+        before = _metrics(store, conn, job_ids)
+        conn.executemany(
+            f"INSERT INTO quotes (job_id, {', '.join(QUOTE_COLUMNS)}) "
+            f"VALUES (:job_id, {', '.join(':' + c for c in QUOTE_COLUMNS)}) ON CONFLICT(job_id, id) DO NOTHING",
+            # Archived jobs' child rows omit their NULL columns
+            [{col: record.get(col) for col in ["job_id"] + QUOTE_COLUMNS} for record in records],
+        )
+        conn.executemany(
+            "UPDATE jobs SET"
+            " quote_count = (SELECT COUNT(*) FROM quotes WHERE job_id = :id),"
+            " max_quote = (SELECT MAX(amount) FROM quotes WHERE job_id = :id)"
+            " WHERE id = :id",
+            [{"id": job_id} for job_id in job_ids],
+        )
+        store._apply_metric_delta(conn, before, _metrics(store, conn, job_ids))
+    else:
+        columns = {"messages": MESSAGE_COLUMNS, "photos": PHOTO_COLUMNS, "videos": VIDEO_COLUMNS}[name]
+        conn.executemany(
+            f"INSERT INTO {name} (job_id, {', '.join(columns)}) "
+            f"VALUES (:job_id, {', '.join(':' + c for c in columns)})",
+            [{col: record.get(col) for col in ["job_id"] + columns} for record in records],
+        )
+        counter = {"messages": "message_count", "photos": "photo_count"}.get(name)
+        if counter:
+            conn.executemany(
+                f"UPDATE jobs SET {counter} = {counter} + ? WHERE id = ?",
+                [(n, job_id) for job_id, n in Counter(r["job_id"] for r in records).items()],
+            )
+    for job_id in job_ids:
+        store._publish(job_id, "import")
+    return len(records)
+
+
+def _insert_archived(store: JobStore, conn: sqlite3.Connection, source: str, records: List[Dict]) -> List[str]:
+    """Insert archived jobs as live ones; returns the ids inserted, for the caller to
+    move back to cold storage once this transaction commits."""
+    _insert(store, conn, "jobs", source, [
+        # Frames written before jobs had a closed column: it was closed by the time it was archived
+        {**{col: record.get(col) for col in JOB_COLUMNS + ["completed"]},
+         "closed": record.get("closed") or record.get("completed") or record.get("archived")}
+        for record in records
+    ])
+    for name in ARCHIVED_CHILDREN:
+        rows = [{**row, "job_id": record["id"]} for record in records for row in record.get(name, [])]
+        if rows:
+            _insert(store, conn, name, source, rows)
+    ids = [record["id"] for record in records]
+    skipped = {
+        row[0] for row in conn.execute(
+            f"SELECT job_id FROM transfer_skipped WHERE source = ? AND job_id IN ({', '.join('?' * len(ids))})",
+            [source] + ids,
+        )
+    }
+    return [job_id for job_id in ids if job_id not in skipped]
+
+
+def _import_media(blobs: BlobStore, media: BlobStore, name: str, records: List[Dict]):
+    for record in records:
+        for col in MEDIA_COLUMNS.get(name, []):
+            digest = record.get(col)
+            # Blobs that were already missing at the source stay missing
+            if not digest or blobs.exists(digest) or not media.exists(digest):
+                continue
+            with open(media.path(digest), "rb") as f:
+                copied, _ = blobs.put_stream(f)
+            if copied != digest:
+                raise ValueError(f"media file {digest} is corrupt (content hashes to {copied})")
+
+
+def import_jobs(
+    store: JobStore,
+    path: str,
+    blobs: Optional[BlobStore] = None,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Progress] = None,
+) -> Dict[str, int]:
+    """Load the export at `path` into the store, resuming where a previous run stopped.
+
+    Returns the number of rows inserted per file by this run. Media is copied into the
+    blob store before the rows that reference it are committed.
+    """
+    store.conn.executescript(SCHEMA)
+    manifest = read_manifest(path)
+    source = manifest["id"]
+    blobs = blobs or BlobStore()
+    media = BlobStore(os.path.join(path, "media"))
+    cold = store.archive or ColdStore(store)
+    inserted = {}
+
+    for name in [table[0] for table in TABLES] + [ARCHIVED]:
+        with store._tx() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO transfer_progress (source, name) VALUES (?, ?)", (source, name)
+            )
+            state = conn.execute(
+                "SELECT offset, rows, done FROM transfer_progress WHERE source = ? AND name = ?",
+                (source, name),
+            ).fetchone()
+        inserted[name] = 0
+        if state["done"]:
+            continue
+        total = manifest["counts"].get(name, 0)
+        offset, rows = state["offset"], state["rows"]
+        if not os.path.exists(os.path.join(path, f"{name}.ndjson")):
+            # Exports made before archived jobs were included
+            continue
+        with open(os.path.join(path, f"{name}.ndjson"), "rb") as f:
+            f.seek(offset)
+            while True:
+                lines = []
+                while len(lines) < batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        lines.append(line)
+                records = [json.loads(line) for line in lines]
+                restored = []
+                if name == ARCHIVED:
+                    for child in ("photos", "videos"):
+                        _import_media(blobs, media, child, [row for record in records for row in record.get(child, [])])
+                else:
+                    _import_media(blobs, media, name, records)
+                with store._tx() as conn:
+                    if records and name == ARCHIVED:
+                        restored = _insert_archived(store, conn, source, records)
+                    elif records:
+                        inserted[name] += _insert(store, conn, name, source, records)
+                    offset, rows = f.tell(), rows + len(records)
+                    conn.execute(
+                        "UPDATE transfer_progress SET offset = ?, rows = ?, done = ? WHERE source = ? AND name = ?",
+                        (offset, rows, len(lines) < batch_size, source, name),
+                    )
+                if restored:
+                    # If this is interrupted the jobs stay live until the archiver next runs
+                    inserted[name] += cold.move(restored)
+                if progress:
+                    progress(name, rows, total)
+                if len(lines) < batch_size:
+                    break
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="write every job to a new export directory")
+    export_cmd.add_argument("path")
+    export_cmd.add_argument("--parquet", action="store_true", help="also write a .parquet file per table")
+    import_cmd = commands.add_parser("import", help="load (or resume loading) an export directory")
+    import_cmd.add_argument("path")
+    for cmd in (export_cmd, import_cmd):
+        cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from events import EventBus
+    from search import SearchIndex
+
+    store = JobStore()
+    EventBus(store)
+    SearchIndex(store)
+    ColdStore(store)
+
+    def report(name: str, done: int, total: int):
+        print(f"\r{name}: {done:,}/{total:,}", end="\n" if done >= total else "", flush=True)
+
+    if args.command == "export":
+        os.makedirs(args.path, exist_ok=True)
+        manifest = export_jobs(store, args.path, parquet=args.parquet, batch_size=args.batch_size, progress=report)
+        print(f"Exported {manifest['counts']} and {manifest['media']:,} media files to {args.path}")
+        if manifest["missing_media"]:
+            print(f"{manifest['missing_media']:,} referenced media files were missing from the blob store")
+    else:
+        inserted = import_jobs(store, args.path, batch_size=args.batch_size, progress=report)
+        print(f"Imported {inserted}")
+
+
+if __name__ == "__main__":
+    main()